@@ -0,0 +1,188 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Awaitable wrappers for the blocking Device and Disk calls. Every call
+runs in a bounded thread pool and calls on the same device run one at
+a time, in the order they were made::
+
+    import asyncio      # trollius on Python 2
+    from reparted import *
+    from reparted import aio
+
+    loop = asyncio.get_event_loop()
+    disk = loop.run_until_complete(aio.open_disk("/dev/sdb"))
+    loop.run_until_complete(disk.apply_layout([(Size(512, "MB"), 'NORMAL', 'fat32', 'boot')]))
+    layouts = loop.run_until_complete(aio.gather_disks(["/dev/sdb", "/dev/sdc"]))
+
+This module needs asyncio, on Python 2 install trollius (which brings
+the futures backport) to use it.
+"""
+
+from device import Device
+from disk import Disk
+from functools import partial
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        raise ImportError("reparted.aio needs asyncio, install trollius on Python 2.")
+
+from concurrent.futures import ThreadPoolExecutor
+
+max_workers = 8
+
+_executor = None
+_tails = {}
+
+def set_max_workers(workers):
+    """
+    Sets the number of threads blocking calls are offloaded to. Takes
+    effect for calls made after it.
+    """
+    global max_workers, _executor
+    max_workers = workers
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers)
+    return _executor
+
+def run(key, fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) in the thread pool once the previous call
+    made with the same key (usually the device path) has finished, and
+    returns an asyncio future of its result.
+
+    .. note::
+
+        Cancelling the returned future (ie. asyncio.wait_for timing out)
+        can not stop a call already running in its thread, the next call
+        with the same key still waits for it to return. A call cancelled
+        before it started is skipped.
+    """
+    loop = asyncio.get_event_loop()
+    done = asyncio.Future(loop=loop)
+    # Resolved once fn has returned in its thread, or was skipped, the
+    # next call with the same key waits on this rather than on done.
+    turn = asyncio.Future(loop=loop)
+    tail = (loop, key)
+    prev = _tails.get(tail)
+    _tails[tail] = turn
+
+    def release():
+        if _tails.get(tail) is turn:
+            del _tails[tail]
+        turn.set_result(None)
+
+    def finish(fut):
+        release()
+        if done.cancelled():
+            return
+        if fut.cancelled():
+            done.cancel()
+        elif fut.exception() is not None:
+            done.set_exception(fut.exception())
+        else:
+            done.set_result(fut.result())
+
+    def start(_=None):
+        if done.cancelled():
+            release()
+            return
+        fut = loop.run_in_executor(_get_executor(), partial(fn, *args, **kwargs))
+        fut.add_done_callback(finish)
+
+    if prev is None or prev.done():
+        start()
+    else:
+        prev.add_done_callback(start)
+    return done
+
+class AsyncDisk(object):
+    """
+    *AsyncDisk class wraps a Disk instance with methods returning
+    asyncio futures.*
+
+    *Args:*
+
+    *   disk:   A Disk class instance.
+    """
+    def __init__(self, disk):
+        self.disk = disk
+        self._key = disk.device.path
+
+    def call(self, method, *args, **kwargs):
+        """
+        Runs any Disk method by name, returns a future of its result.
+        """
+        return run(self._key, getattr(self.disk, method), *args, **kwargs)
+
+    def layout(self):
+        return self.call('layout')
+
+    def partitions(self):
+        return self.call('partitions')
+
+    def free_partitions(self):
+        return self.call('free_partitions')
+
+    def add_partition(self, part):
+        return self.call('add_partition', part)
+
+    def delete_partition(self, part):
+        return self.call('delete_partition', part)
+
+    def apply_layout(self, specs, align='optimal', mode='full'):
+        return self.call('apply_layout', specs, align, mode)
+
+    def set_label(self, label):
+        return self.call('set_label', label)
+
+    def commit(self, mode='full'):
+        return self.call('commit', mode)
+
+def open_device(path):
+    """
+    Returns a future of the Device instance for path.
+    """
+    return run(path, Device, path)
+
+def open_disk(device):
+    """
+    Returns a future of the AsyncDisk for a Device instance or device path.
+    """
+    def new_disk():
+        dev = device if isinstance(device, Device) else Device(device)
+        return AsyncDisk(Disk(dev))
+    return run(getattr(device, 'path', device), new_disk)
+
+def gather_disks(paths, return_exceptions=True):
+    """
+    Returns a future of the layouts for several device paths, as a list
+    of (num, type, geom) tuples per path (or the exception raised for that
+    path). The devices are read concurrently, up to max_workers at a time.
+    """
+    def read(path):
+        return [(e.num, e.type, e.geom) for e in Disk(Device(path)).layout()]
+    return asyncio.gather(*[run(path, read, path) for path in paths],
+                          return_exceptions=return_exceptions)
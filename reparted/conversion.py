@@ -15,13 +15,201 @@
 
 from ctypes.util import find_library
 from ctypes import *
+import threading
+import weakref
+import time
+import os
 
-lib = find_library("parted")
+# Set to the path of libparted to skip the find_library lookup.
+library_env = "REPARTED_LIBPARTED"
 
-if not lib:
-    raise Exception("Parted library not found.")
+class LazyLibrary(object):
+    """
+    Loads libparted on first attribute access, so importing reparted
+    does not run find_library or fail when the library is missing.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._cdll = None
 
-parted = CDLL(lib)
+    def _load(self):
+        if self._cdll is None:
+            lib = os.environ.get(library_env) or find_library(self._name)
+            if not lib:
+                raise Exception("Parted library not found.")
+            self._cdll = CDLL(lib)
+        return self._cdll
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+parted = LazyLibrary("parted")
+
+# Resource kind of the functions that allocate (1) or destroy (-1) handles.
+allocations = {
+    'ped_constraint_new' : ('constraint', 1),
+    'ped_constraint_intersect' : ('constraint', 1),
+    'ped_device_get_constraint' : ('constraint', 1),
+    'ped_device_get_optimal_aligned_constraint' : ('constraint', 1),
+    'ped_device_get_minimal_aligned_constraint' : ('constraint', 1),
+    'ped_constraint_destroy' : ('constraint', -1),
+    'ped_geometry_new' : ('geometry', 1),
+    'ped_geometry_destroy' : ('geometry', -1),
+    'ped_device_get_optimum_alignment' : ('alignment', 1),
+    'ped_device_get_minimum_alignment' : ('alignment', 1),
+    'ped_alignment_destroy' : ('alignment', -1),
+    'ped_disk_new' : ('disk', 1),
+    'ped_disk_new_fresh' : ('disk', 1),
+    'ped_disk_duplicate' : ('disk', 1),
+    'ped_disk_destroy' : ('disk', -1),
+}
+
+class Instrumentation(object):
+    """
+    Collects per function call counts and latencies, and allocation and
+    destroy counts, of the libparted calls while enabled.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.callback = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+            self.allocations = {}
+
+    def record(self, name, elapsed):
+        with self._lock:
+            stat = self.calls.get(name)
+            if stat is None:
+                stat = self.calls[name] = [0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += elapsed
+            if elapsed > stat[2]:
+                stat[2] = elapsed
+            if name in allocations:
+                kind, step = allocations[name]
+                counts = self.allocations.setdefault(kind, [0, 0])
+                counts[0 if step > 0 else 1] += 1
+        if self.callback is not None:
+            self.callback(name, elapsed)
+
+    def stats(self):
+        with self._lock:
+            calls = dict((name, {'count': c, 'total': t, 'max': m})
+                         for name, (c, t, m) in self.calls.items())
+            allocs = dict((kind, {'created': c, 'destroyed': d})
+                          for kind, (c, d) in self.allocations.items())
+        return {'calls': calls, 'allocations': allocs}
+
+instrumentation = Instrumentation()
+
+functions = []
+
+class LazyFunction(object):
+    """
+    Resolves a libparted function and sets its argtypes and restype
+    on first call.
+    """
+    def __init__(self, name, restype=c_int, argtypes=None):
+        self.name = name
+        self.restype = restype
+        self.argtypes = argtypes
+        self._raw = None
+        self._fn = None
+        functions.append(self)
+
+    def _resolve(self):
+        fn = getattr(parted, self.name)
+        fn.restype = self.restype
+        if self.argtypes is not None:
+            fn.argtypes = self.argtypes
+        self._raw = fn
+        self._instrument(instrumentation.enabled)
+        return self._fn
+
+    def _instrument(self, enabled):
+        raw = self._raw
+        if raw is None or not enabled:
+            self._fn = raw
+            return
+        name = self.name
+        def timed(*args):
+            started = time.time()
+            try:
+                return raw(*args)
+            finally:
+                instrumentation.record(name, time.time() - started)
+        self._fn = timed
+
+    def __call__(self, *args):
+        fn = self._fn
+        if fn is None:
+            fn = self._resolve()
+        return fn(*args)
+
+_finalizers = set()
+_finalizers_lock = threading.Lock()
+
+def finalize(obj, fn, *args):
+    """
+    Registers fn(*args) to be called once obj is garbage collected and
+    returns a callable that runs it right away instead. Either way fn is
+    called at most once. fn and args must not reference obj.
+    """
+    def run(ref=None):
+        with _finalizers_lock:
+            if ref not in _finalizers:
+                return
+            _finalizers.discard(ref)
+        fn(*args)
+    ref = weakref.ref(obj, run)
+    with _finalizers_lock:
+        _finalizers.add(ref)
+    return lambda: run(ref)
+
+def enable_instrumentation(callback=None):
+    """
+    Starts recording libparted call statistics. If given, callback is
+    called with the (function name, elapsed seconds) of every call, ie.
+    to feed a metrics exporter. When disabled, the default, calls go
+    straight to libparted.
+    """
+    instrumentation.callback = callback
+    instrumentation.enabled = True
+    for fn in functions:
+        fn._instrument(True)
+
+def disable_instrumentation():
+    """
+    Stops recording libparted call statistics, the collected statistics
+    are kept until reset_instrumentation is called.
+    """
+    instrumentation.enabled = False
+    instrumentation.callback = None
+    for fn in functions:
+        fn._instrument(False)
+
+def reset_instrumentation():
+    """
+    Clears the collected libparted call statistics.
+    """
+    instrumentation.reset()
+
+def instrumentation_stats():
+    """
+    Returns the collected libparted call statistics as a dict::
+
+        {'calls': {'ped_disk_new': {'count': 2, 'total': 0.0132, 'max': 0.0101}, ...},
+         'allocations': {'constraint': {'created': 12, 'destroyed': 9}, ...}}
+
+    Where total and max are in seconds.
+    """
+    return instrumentation.stats()
 
 class PedCHSGeometry(Structure):
     _fields_ = [
@@ -158,86 +346,45 @@ class PedConstraint(Structure):
      ]
 
 # Device Function conversions
-device_get = parted.ped_device_get
-device_get.restype = POINTER(PedDevice)
-device_get_constraint = parted.ped_device_get_constraint
-device_get_constraint.restype = POINTER(PedConstraint)
-device_get_optimal_aligned_constraint = parted.ped_device_get_optimal_aligned_constraint
-device_get_optimal_aligned_constraint.argtypes = [POINTER(PedDevice)]
-device_get_optimal_aligned_constraint.restype = POINTER(PedConstraint)
-device_get_minimal_aligned_constraint = parted.ped_device_get_minimal_aligned_constraint
-device_get_minimal_aligned_constraint.argtypes = [POINTER(PedDevice)]
-device_get_minimal_aligned_constraint.restype = POINTER(PedConstraint)
-device_get_optimum_alignment = parted.ped_device_get_optimum_alignment
-device_get_optimum_alignment.argtypes = [POINTER(PedDevice)]
-device_get_optimum_alignment.restype = POINTER(PedAlignment)
-device_get_minimum_alignment = parted.ped_device_get_minimum_alignment
-device_get_minimum_alignment.argtypes = [POINTER(PedDevice)]
-device_get_minimum_alignment.restype = POINTER(PedAlignment)
-device_get__constraint = parted.ped_device_get_constraint
-device_get_constraint.argtypes = [POINTER(PedDevice)]
-device_get_constraint.restype = POINTER(PedConstraint)
+device_get = LazyFunction('ped_device_get', restype=POINTER(PedDevice))
+device_destroy = LazyFunction('ped_device_destroy', restype=None, argtypes=[POINTER(PedDevice)])
+device_get_constraint = LazyFunction('ped_device_get_constraint', restype=POINTER(PedConstraint), argtypes=[POINTER(PedDevice)])
+device_get_optimal_aligned_constraint = LazyFunction('ped_device_get_optimal_aligned_constraint', restype=POINTER(PedConstraint), argtypes=[POINTER(PedDevice)])
+device_get_minimal_aligned_constraint = LazyFunction('ped_device_get_minimal_aligned_constraint', restype=POINTER(PedConstraint), argtypes=[POINTER(PedDevice)])
+device_get_optimum_alignment = LazyFunction('ped_device_get_optimum_alignment', restype=POINTER(PedAlignment), argtypes=[POINTER(PedDevice)])
+alignment_destroy = LazyFunction('ped_alignment_destroy', restype=None, argtypes=[POINTER(PedAlignment)])
+device_get_minimum_alignment = LazyFunction('ped_device_get_minimum_alignment', restype=POINTER(PedAlignment), argtypes=[POINTER(PedDevice)])
 
 # Disk Function conversions
-disk_probe = parted.ped_disk_probe
-disk_probe.restype = POINTER(PedDiskType)
-disk_new = parted.ped_disk_new
-disk_new.restype = POINTER(PedDisk)
-disk_new_fresh = parted.ped_disk_new_fresh
-disk_new_fresh.argtypes = [POINTER(PedDevice), POINTER(PedDiskType)]
-disk_new_fresh.restype = POINTER(PedDisk)
-disk_add_partition = parted.ped_disk_add_partition
-disk_add_partition.argtypes = [POINTER(PedDisk), POINTER(PedPartition), POINTER(PedConstraint)]
-disk_next_partition = parted.ped_disk_next_partition
-disk_next_partition.argtypes = [POINTER(PedDisk), POINTER(PedPartition)]
-disk_next_partition.restype = POINTER(PedPartition)
-disk_get_last_partition_num = parted.ped_disk_get_last_partition_num
-disk_get_last_partition_num.argtypes = [POINTER(PedDisk)]
-disk_get_partition = parted.ped_disk_get_partition
-disk_get_partition.argtypes = [POINTER(PedDisk), c_int]
-disk_get_partition.restype = POINTER(PedPartition)
-disk_delete_partition = parted.ped_disk_delete_partition
-disk_delete_partition.argtypes = [POINTER(PedDisk), POINTER(PedPartition)]
-disk_delete_all = parted.ped_disk_delete_all
-disk_delete_all.argtypes = [POINTER(PedDisk)]
-disk_commit_to_os = parted.ped_disk_commit_to_os
-disk_commit_to_os.argtypes = [POINTER(PedDisk)]
-disk_commit_to_dev = parted.ped_disk_commit_to_dev
-disk_commit_to_dev.argtypes = [POINTER(PedDisk)]
-disk_destroy = parted.ped_disk_destroy
-disk_destroy.argtypes = [POINTER(PedDisk)]
-disk_destroy.restype = None
-disk_get_type = parted.ped_disk_type_get
-disk_get_type.restype = POINTER(PedDiskType)
-disk_remove_partition = parted.ped_disk_remove_partition
-disk_remove_partition.argtypes = [POINTER(PedDisk), POINTER(PedPartition)]
+disk_probe = LazyFunction('ped_disk_probe', restype=POINTER(PedDiskType))
+disk_new = LazyFunction('ped_disk_new', restype=POINTER(PedDisk))
+disk_new_fresh = LazyFunction('ped_disk_new_fresh', restype=POINTER(PedDisk), argtypes=[POINTER(PedDevice), POINTER(PedDiskType)])
+disk_add_partition = LazyFunction('ped_disk_add_partition', argtypes=[POINTER(PedDisk), POINTER(PedPartition), POINTER(PedConstraint)])
+disk_next_partition = LazyFunction('ped_disk_next_partition', restype=POINTER(PedPartition), argtypes=[POINTER(PedDisk), POINTER(PedPartition)])
+disk_get_last_partition_num = LazyFunction('ped_disk_get_last_partition_num', argtypes=[POINTER(PedDisk)])
+disk_get_partition = LazyFunction('ped_disk_get_partition', restype=POINTER(PedPartition), argtypes=[POINTER(PedDisk), c_int])
+disk_delete_partition = LazyFunction('ped_disk_delete_partition', argtypes=[POINTER(PedDisk), POINTER(PedPartition)])
+disk_delete_all = LazyFunction('ped_disk_delete_all', argtypes=[POINTER(PedDisk)])
+disk_commit_to_os = LazyFunction('ped_disk_commit_to_os', argtypes=[POINTER(PedDisk)])
+disk_commit_to_dev = LazyFunction('ped_disk_commit_to_dev', argtypes=[POINTER(PedDisk)])
+disk_duplicate = LazyFunction('ped_disk_duplicate', restype=POINTER(PedDisk), argtypes=[POINTER(PedDisk)])
+disk_destroy = LazyFunction('ped_disk_destroy', restype=None, argtypes=[POINTER(PedDisk)])
+disk_get_type = LazyFunction('ped_disk_type_get', restype=POINTER(PedDiskType))
+disk_set_partition_geom = LazyFunction('ped_disk_set_partition_geom', argtypes=[POINTER(PedDisk), POINTER(PedPartition), POINTER(PedConstraint), PedSector, PedSector])
+disk_remove_partition = LazyFunction('ped_disk_remove_partition', argtypes=[POINTER(PedDisk), POINTER(PedPartition)])
 
 # Partition Function conversions
-partition_new = parted.ped_partition_new
-partition_new.argtypes = [POINTER(PedDisk), c_int, POINTER(PedFileSystemType), PedSector, PedSector]
-partition_new.restype = POINTER(PedPartition)
-partition_is_busy = parted.ped_partition_is_busy
-partition_is_busy.argtypes = [POINTER(PedPartition)]
-partition_get_name = parted.ped_partition_get_name
-partition_get_name.argtypes = [POINTER(PedPartition)]
-partition_get_name.restype = c_char_p
-partition_set_name = parted.ped_partition_set_name
-partition_set_name.argtypes = [POINTER(PedPartition), c_char_p]
-partition_is_flag_available = parted.ped_partition_is_flag_available
-partition_is_flag_available.argtypes = [POINTER(PedPartition), c_int]
-partition_set_flag = parted.ped_partition_set_flag
-partition_set_flag.argtypes = [POINTER(PedPartition), c_int, c_int]
-geometry_new = parted.ped_geometry_new
-geometry_new.argtypes = [POINTER(PedDevice), PedSector, PedSector]
-geometry_new.restype = POINTER(PedGeometry)
-constraint_new = parted.ped_constraint_new
-constraint_new.argtypes = [POINTER(PedAlignment), POINTER(PedAlignment), POINTER(PedGeometry), POINTER(PedGeometry), PedSector, PedSector]
-constraint_new.restype = POINTER(PedConstraint)
-constraint_intersect = parted.ped_constraint_intersect
-constraint_intersect.argtypes = [POINTER(PedConstraint), POINTER(PedConstraint)]
-constraint_intersect.restype = POINTER(PedConstraint)
-constraint_destroy = parted.ped_constraint_destroy
-constraint_destroy.argtypes = [POINTER(PedConstraint)]
-file_system_type_get = parted.ped_file_system_type_get
-file_system_type_get.argtypes = [c_char_p]
-file_system_type_get.restype = POINTER(PedFileSystemType)
\ No newline at end of file
+partition_new = LazyFunction('ped_partition_new', restype=POINTER(PedPartition), argtypes=[POINTER(PedDisk), c_int, POINTER(PedFileSystemType), PedSector, PedSector])
+partition_destroy = LazyFunction('ped_partition_destroy', restype=None, argtypes=[POINTER(PedPartition)])
+partition_is_busy = LazyFunction('ped_partition_is_busy', argtypes=[POINTER(PedPartition)])
+partition_get_name = LazyFunction('ped_partition_get_name', restype=c_char_p, argtypes=[POINTER(PedPartition)])
+partition_set_name = LazyFunction('ped_partition_set_name', argtypes=[POINTER(PedPartition), c_char_p])
+partition_is_flag_available = LazyFunction('ped_partition_is_flag_available', argtypes=[POINTER(PedPartition), c_int])
+partition_get_flag = LazyFunction('ped_partition_get_flag', argtypes=[POINTER(PedPartition), c_int])
+partition_set_flag = LazyFunction('ped_partition_set_flag', argtypes=[POINTER(PedPartition), c_int, c_int])
+geometry_new = LazyFunction('ped_geometry_new', restype=POINTER(PedGeometry), argtypes=[POINTER(PedDevice), PedSector, PedSector])
+geometry_destroy = LazyFunction('ped_geometry_destroy', restype=None, argtypes=[POINTER(PedGeometry)])
+constraint_new = LazyFunction('ped_constraint_new', restype=POINTER(PedConstraint), argtypes=[POINTER(PedAlignment), POINTER(PedAlignment), POINTER(PedGeometry), POINTER(PedGeometry), PedSector, PedSector])
+constraint_intersect = LazyFunction('ped_constraint_intersect', restype=POINTER(PedConstraint), argtypes=[POINTER(PedConstraint), POINTER(PedConstraint)])
+constraint_destroy = LazyFunction('ped_constraint_destroy', argtypes=[POINTER(PedConstraint)])
+file_system_type_get = LazyFunction('ped_file_system_type_get', restype=POINTER(PedFileSystemType), argtypes=[c_char_p])
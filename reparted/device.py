@@ -15,10 +15,17 @@
 
 from conversion import *
 from size import *
-from disk import Disk
 from exception import DeviceError
+from collections import namedtuple
+import threading
+import time
 import os
 
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
 device_type = {
     0 : 'UNKNOWN',
     1 : 'SCSI',
@@ -57,10 +64,75 @@ standard_devices = [
     "/dev/sdf"
 ]
 
+sys_block = "/sys/block"
+
+alignment_getters = {
+    'optimal' : device_get_optimum_alignment,
+    'minimal' : device_get_minimum_alignment
+}
+
+constraint_getters = {
+    'optimal' : device_get_optimal_aligned_constraint,
+    'minimal' : device_get_minimal_aligned_constraint,
+    None : device_get_constraint
+}
+
+DeviceInfo = namedtuple('DeviceInfo', ['model', 'path', 'type', 'sector_size',
+                                       'phys_sector_size', 'length', 'open_count',
+                                       'read_only', 'external_mode', 'dirty',
+                                       'boot_dirty', 'hw_geom', 'bios_geom',
+                                       'host', 'did'])
+
+def device_info(dev):
+    """
+    Reads a ped_device struct once into a DeviceInfo tuple.
+    """
+    c = dev.contents
+    hw = c.hw_geom
+    bios = c.bios_geom
+    return DeviceInfo(c.model, c.path, c.type, c.sector_size,
+                      c.phys_sector_size, c.length, c.open_count,
+                      bool(c.read_only), bool(c.external_mode), bool(c.dirty),
+                      bool(c.boot_dirty), (hw.cylinders, hw.heads, hw.sectors),
+                      (bios.cylinders, bios.heads, bios.sectors), c.host, c.did)
+
+# Devices returned by ped_device_get are shared per path, so they are
+# reference counted by address and destroyed when the last Device closes.
+device_refs = {}
+device_refs_lock = threading.Lock()
+
+# ped_device_get and ped_device_destroy change libparted's global device
+# list, which has no locking of its own. ped_device_get also probes the
+# device while holding it, so device discovery is serial.
+device_list_lock = threading.Lock()
+
+def _device_address(dev):
+    return cast(dev, c_void_p).value
+
+def acquire_device(dev):
+    address = _device_address(dev)
+    with device_refs_lock:
+        device_refs[address] = device_refs.get(address, 0) + 1
+
+def release_device(dev, constraints):
+    for constraint in constraints.values():
+        constraint_destroy(constraint)
+    constraints.clear()
+    address = _device_address(dev)
+    with device_refs_lock:
+        count = device_refs.get(address, 1) - 1
+        if count > 0:
+            device_refs[address] = count
+            return
+        device_refs.pop(address, None)
+    with device_list_lock:
+        device_destroy(dev)
+
 def device_probe(path):
     if not os.path.exists(path):
         return False
-    dev = device_get(path)
+    with device_list_lock:
+        dev = device_get(path)
     if bool(dev):
         return dev
     else:
@@ -94,7 +166,9 @@ class Device(object):
     .. note::
 
        If called without any parameters it will probe all standard devices
-       and default to the first one it finds.
+       and default to the first one it finds. The ped_device is released
+       by close, on leaving a with block or when the instance is garbage
+       collected.
 
     """
     def __init__(self, path=None, dev=None):
@@ -110,9 +184,26 @@ class Device(object):
             self._device = self._probe_ped_device()
         if not bool(self._device):
             raise DeviceError(500)
-        length = self.length * self.sector_size
-        size = Size(length=length, units="B", dev=self)
-        self._size = size
+        self._alignments = {}
+        self._constraints = {}
+        acquire_device(self._device)
+        self._release = finalize(self, release_device, self._device, self._constraints)
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self):
+        """
+        Re-reads the device attributes from the ped_device struct. Device
+        properties are read once when the instance is created, call this
+        method if libparted updated the device since then.
+        """
+        self._info = device_info(self._ped_device)
+        self._size = Size.from_sectors(self._info.length, self._info.sector_size)
 
     @property
     def _ped_device(self):
@@ -126,74 +217,74 @@ class Device(object):
         """
         Returns the length in sectors of the device.
         """
-        return self._ped_device.contents.length
+        return self._info.length
 
     @property
     def path(self):
         """
         Returns the device path (ie. '/dev/sda').
         """
-        return self._ped_device.contents.path
+        return self._info.path
 
     @property
     def model(self):
         """
         Returns the device model (ie. 'ATA VBOX HARDDISK').
         """
-        return self._ped_device.contents.model
+        return self._info.model
 
     @property
     def type(self):
         """
         Returns the device type (ie. 'SCSI').
         """
-        return device_type[self._ped_device.contents.type]
+        return device_type[self._info.type]
 
     @property
     def sector_size(self):
-        return self._ped_device.contents.sector_size
+        return self._info.sector_size
 
     @property
     def phys_sector_size(self):
         """
         Returns the physical sector size.
         """
-        return self._ped_device.contents.phys_sector_size
+        return self._info.phys_sector_size
 
     @property
     def open_count(self):
         """
         Returns the number of times the device has been opened.
         """
-        return self._ped_device.contents.open_count
+        return self._info.open_count
 
     @property
     def read_only(self):
         """
         Returns True if the device is set as read only.
         """
-        return bool(self._ped_device.contents.read_only)
+        return self._info.read_only
 
     @property
     def external_mode(self):
         """
         Returns True if the device is set to external mode.
         """
-        return bool(self._ped_device.contents.path)
+        return self._info.external_mode
 
     @property
     def dirty(self):
         """
         Returns True if the device is dirty.
         """
-        return bool(self._ped_device.contents.dirty)
+        return self._info.dirty
 
     @property
     def boot_dirty(self):
         """
         Returns True if the device is set to boot dirty.
         """
-        return bool(self._ped_device.contents.boot_dirty)
+        return self._info.boot_dirty
 
     @property
     def hw_geom(self):
@@ -202,10 +293,7 @@ class Device(object):
 
             (cylinders, heads, sectors)
         """
-        cylinders = self._ped_device.contents.hw_geom.cylinders
-        heads = self._ped_device.contents.hw_geom.heads
-        sectors = self._ped_device.contents.hw_geom.sectors
-        return (cylinders, heads, sectors)
+        return self._info.hw_geom
 
     @property
     def bios_geom(self):
@@ -214,24 +302,21 @@ class Device(object):
 
             (cylinders, heads, sectors)
         """
-        cylinders = self._ped_device.contents.bios_geom.cylinders
-        heads = self._ped_device.contents.bios_geom.heads
-        sectors = self._ped_device.contents.bios_geom.sectors
-        return (cylinders, heads, sectors)
+        return self._info.bios_geom
 
     @property
     def host(self):
         """
         Returns the device host.
         """
-        return self._ped_device.contents.host
+        return self._info.host
 
     @property
     def did(self):
         """
         Returns the device did.
         """
-        return self._ped_device.contents.did
+        return self._info.did
 
     @property
     def size(self):
@@ -240,6 +325,86 @@ class Device(object):
         """
         return self._size
 
+    def to_dict(self):
+        """
+        Returns the device attributes as a dict of plain values, ready to be
+        serialized (ie. with json or msgpack).
+        """
+        info = self._info._asdict()
+        info['type'] = device_type[self._info.type]
+        info['hw_geom'] = list(self._info.hw_geom)
+        info['bios_geom'] = list(self._info.bios_geom)
+        return dict(info)
+
+    def get_alignment(self, align='optimal'):
+        """
+        Returns the device alignment as a 2-tuple:
+
+            (offset, grain_size)
+
+        The values are read once per device and cached until close is called.
+        If the device does not report the alignment it returns None.
+
+        *Args:*
+
+        *       align (str):    The alignment, 'optimal' or 'minimal'.
+
+        *Raises:*
+
+        *       DeviceError
+        """
+        try:
+            return self._alignments[align]
+        except KeyError:
+            pass
+        if align not in alignment_getters:
+            raise DeviceError(501)
+        alignment = alignment_getters[align](self._ped_device)
+        if bool(alignment):
+            value = (alignment.contents.offset, alignment.contents.grain_size)
+            alignment_destroy(alignment)
+        else:
+            value = None
+        self._alignments[align] = value
+        return value
+
+    def _get_constraint(self, align=None):
+        """
+        Returns the cached ctypes ped_constraint pointer for the 'optimal',
+        'minimal' or (if None) plain device constraint. The constraint is
+        owned by the device and destroyed by close, do not destroy it.
+        """
+        try:
+            return self._constraints[align]
+        except KeyError:
+            pass
+        if align not in constraint_getters:
+            raise DeviceError(501)
+        constraint = constraint_getters[align](self._ped_device)
+        if bool(constraint):
+            self._constraints[align] = constraint
+        return constraint
+
+    def close(self):
+        """
+        Releases the cached alignment values and constraints and the
+        ped_device, once no other Device instance uses it. This is also
+        done when the instance is garbage collected, or on leaving a with
+        block::
+
+            with Device("/dev/sdb") as myDevice:
+                with Disk(myDevice) as myDisk:
+                    partitions = myDisk.partitions()
+
+        .. note::
+
+            The Device can not be used once closed. A Disk of the device
+            keeps the ped_device until it is closed too.
+        """
+        self._release()
+        self._alignments.clear()
+        self._device = None
+
     def _probe_ped_device(self):
         for path in standard_devices:
             dev = device_probe(path)
@@ -264,4 +429,133 @@ def probe_standard_devices():
         if dev:
             device = Device(dev=dev)
             devices.append(device)
-    return devices
\ No newline at end of file
+    return devices
+
+def block_devices():
+    """
+    This function returns the paths of the block devices listed in
+    /sys/block, skipping those with no media (ie. empty loop devices)::
+
+        from reparted.device import block_devices
+
+        block_devices()
+        ['/dev/sda', '/dev/sdb', '/dev/loop0']
+    """
+    paths = []
+    try:
+        names = sorted(os.listdir(sys_block))
+    except OSError:
+        return paths
+    for name in names:
+        try:
+            with open(os.path.join(sys_block, name, "size")) as f:
+                if not int(f.read().strip() or 0):
+                    continue
+        except (IOError, OSError, ValueError):
+            continue
+        paths.append(os.path.join("/dev", name.replace("!", "/")))
+    return paths
+
+def iter_devices(paths=None, workers=8, timeout=None):
+    """
+    This function probes devices concurrently and yields Device instances
+    as each probe completes. If no paths are given the block devices listed
+    in /sys/block are probed::
+
+        from reparted.device import iter_devices
+
+        for device in iter_devices(workers=16, timeout=5):
+            print device.path
+
+    *Args:*
+
+    *       paths (list):       Device paths to probe, defaults to block_devices().
+    *       workers (int):      Maximum number of concurrent probes.
+    *       timeout (float):    Seconds to wait for a single device probe, devices
+                                that take longer are skipped.
+
+    .. note::
+
+        Devices that fail to probe or time out are skipped silently, the
+        order of the results follows probe completion, not the paths order.
+        Discovery in libparted is serial: ped_device_get does the probing
+        I/O itself and changes libparted's global device list, so it runs
+        under a process wide lock, one device at a time. The workers only
+        open the devices concurrently first, so a device that hangs on open
+        is left behind without taking the lock. A device that hangs inside
+        ped_device_get itself still holds the lock, and every later probe,
+        Device() and pool acquire in the process waits for it; the timeout
+        only stops iter_devices from waiting on its result.
+    """
+    if paths is None:
+        paths = block_devices()
+    pending = Queue()
+    for path in paths:
+        pending.put(path)
+    results = Queue()
+    started = {}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                path = pending.get_nowait()
+            except Empty:
+                return
+            with lock:
+                started[path] = time.time()
+            try:
+                # Wait on the device here, outside the libparted lock.
+                os.close(os.open(path, os.O_RDONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+            try:
+                dev = device_probe(path)
+            except Exception:
+                dev = False
+            results.put((path, dev))
+
+    def spawn():
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+
+    for i in range(min(workers, len(paths))):
+        spawn()
+    remaining = len(paths)
+    expired = set()
+    while remaining:
+        try:
+            path, dev = results.get(timeout=0.1 if timeout else None)
+        except Empty:
+            now = time.time()
+            with lock:
+                late = [p for p, t in started.items()
+                        if p not in expired and now - t > timeout]
+            for p in late:
+                # The stuck worker is abandoned, start another in its place.
+                expired.add(p)
+                remaining -= 1
+                spawn()
+            continue
+        if path in expired:
+            continue
+        with lock:
+            started.pop(path, None)
+        remaining -= 1
+        if dev:
+            yield Device(dev=dev)
+
+def probe_devices(paths=None, workers=8, timeout=None):
+    """
+    This function probes devices concurrently and returns a list
+    containing instances of Device of the found devices. It takes
+    the same arguments as iter_devices::
+
+        from reparted.device import probe_devices
+
+        probe_devices()
+        [<reparted.device.Device object at 0xb7854d8c>,
+        <reparted.device.Device object at 0xb7607eac>]
+    """
+    return list(iter_devices(paths, workers, timeout))
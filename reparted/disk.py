@@ -14,10 +14,18 @@
 #along with reparted.  If not, see <http://www.gnu.org/licenses/>.
 
 from conversion import *
+from device import acquire_device, release_device
 from exception import *
 from size import Size
-from partition import Partition
+from partition import Partition, partition_type, partition_flag
+from freespace import FreeSpaceIndex
+from planner import DiskModel, LayoutSpec, layout_spec
+from scan import scan
+from lock import RWLock
 from functools import wraps
+from collections import namedtuple
+from contextlib import contextmanager
+import json
 import os
 
 disk_features = {
@@ -30,8 +38,32 @@ disk_labels = [
     "msdos"
 ]
 
+commit_modes = [
+    "full",
+    "device",
+    "os",
+    "deferred"
+]
+
+# Disks committed in 'deferred' mode waiting for commit_deferred, by path.
+deferred_disks = {}
+
+# Number of commits made to each device path, a Disk is current with the
+# table on the device if its _commit_generation matches.
+commit_generation = {}
+
+# Flags available by (disk label, partition type), read from the first
+# partition of each kind and shared by all disks.
+flag_availability = {}
+
 alignment_any = PedAlignment(0, 1)
 
+LayoutEntry = namedtuple('LayoutEntry', ['num', 'type', 'geom', 'fs', 'name', 'part'])
+
+DiffOperation = namedtuple('DiffOperation', ['action', 'num', 'value'])
+
+partition_type_code = dict((v, k) for k, v in partition_type.items())
+
 def diskDecorator(error=False):
     """
     Wraps disk methods to check if the instance of
@@ -48,6 +80,19 @@ def diskDecorator(error=False):
         return wrapped
     return wrap
 
+def diskLock(write=False):
+    """
+    Wraps disk methods to hold the disk read lock, or the
+    write lock if write is True, while they run.
+    """
+    def wrap(fn):
+        @wraps(fn)
+        def wrapped(self, *args, **kwargs):
+            with (self._lock.writing() if write else self._lock.reading()):
+                return fn(self, *args, **kwargs)
+        return wrapped
+    return wrap
+
 class Disk(object):
     """
     *Disk class is used as a wrapper to libparted's ped_disk.*
@@ -75,15 +120,70 @@ class Disk(object):
        If a disk is being initialized (no partition table) only the
        set_label method is available, with other methods returning
        None or raising DiskError.
+
+       A Disk can be shared between threads. Listing methods hold a read
+       lock and run in parallel, methods that change the table (including
+       Partition.set_flag and set_name) hold the write lock and run one at
+       a time. A transaction holds the write lock for the whole block.
     """
     def __init__(self, device, disk=None):
+        self._lock = RWLock()
         self._device = device
+        self._owned = [None]
+        self._pending = []
+        self._layout = None
+        self._free_index = None
+        self._index = None
+        self._guids = None
+        self._features = None
+        self._transaction = False
         if disk:
             self._disk = disk
         else:
             self._disk = disk_new(device._ped_device)
             if not bool(self._disk):
                 raise DiskError(600)
+        self._commit_generation = commit_generation.get(device.path, 0)
+        # The ped_disk refers to the ped_device, hold it until the disk
+        # is destroyed even if the Device goes first.
+        acquire_device(device._ped_device)
+        self._release = finalize(self, release_disk, self._owned, self._pending,
+                                 device._ped_device)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _get_disk(self):
+        return self._owned[0]
+
+    def _set_disk(self, disk):
+        self._owned[0] = disk
+
+    _disk = property(_get_disk, _set_disk)
+
+    def _own_partition(self, part):
+        """
+        Tracks a partition created for this disk but not added to it yet,
+        returns the holder the Partition clears when it is added. Pending
+        partitions are destroyed before the ped_disk they refer to.
+        """
+        holder = [part]
+        self._pending[:] = [h for h in self._pending if h[0]]
+        self._pending.append(holder)
+        return holder
+
+    def close(self):
+        """
+        Destroys the ped_disk and any partition created for it that was
+        not added. This is also done when the instance is garbage collected,
+        or on leaving a with block. The Disk can not be used once closed.
+        """
+        with self._lock.writing():
+            self._release()
+            self._invalidate()
 
     @property
     def _ped_device(self):
@@ -122,8 +222,10 @@ class Disk(object):
         Returns the features available (ie. 'EXTENDED' for
         lvm and 'PARTITION_NAME' for label support).
         """
-        feat = self._ped_disk.contents.type.contents.features
-        return disk_features[feat]
+        if self._features is None:
+            feat = self._ped_disk.contents.type.contents.features
+            self._features = disk_features[feat]
+        return self._features
 
     @property
     @diskDecorator()
@@ -150,27 +252,26 @@ class Disk(object):
         return bool(self._ped_disk.contents.update_mode)
 
     @property
+    @diskLock()
     @diskDecorator()
     def total_free_space(self):
         """
         Returns the total free space size as a Size class instance.
         """
-        size = Size()
-        for part in self.free_partitions():
-            size += part.size
-        return size
+        sectors = sum(e.geom[2] for e in self.layout() if e.type == 4)
+        return self._sectors_to_size(sectors)
 
     @property
+    @diskLock()
     @diskDecorator()
     def usable_free_space(self):
         """
         Returns the largest free space size as a Size class instance.
         """
-        size = Size()
-        for part in self.free_partitions():
-            if part.size > size:
-                size = part.size
-        return size
+        extent = self.free_space_index().largest()
+        if extent is None:
+            return self._sectors_to_size(0)
+        return self._sectors_to_size(extent[1] - extent[0] + 1)
 
     @property
     @diskDecorator()
@@ -180,6 +281,141 @@ class Disk(object):
         """
         return self.device.size
 
+    def _sectors_to_size(self, sectors):
+        sector_size = self.device.sector_size
+        return Size(length=sectors * sector_size, units="B", dev=self.device)
+
+    def _invalidate(self, change=None, released=False):
+        """
+        Drops the cached layout snapshot and partition index. If change
+        is the (type, start, end) of a single partition that was added (or
+        released) the free space index is updated in place, otherwise it is
+        dropped too.
+        """
+        self._layout = None
+        self._index = None
+        self._guids = None
+        if change is None:
+            # The table may have been replaced, with a different label.
+            self._features = None
+        if self._free_index is None:
+            return
+        if change is None:
+            self._free_index = None
+            return
+        p_type, start, end = change
+        if p_type & 1:
+            # Logical partitions live inside the extended partition.
+            return
+        if released:
+            self._free_index.add(start, end)
+        else:
+            self._free_index.allocate(start, end)
+
+    def _names_changed(self):
+        """
+        Drops the cached layout snapshot after a partition name changed,
+        the free space index is kept.
+        """
+        self._layout = None
+        self._index = None
+
+    def _extent(self, part):
+        c = part.contents
+        return (c.type, c.geom.start, c.geom.end)
+
+    @diskLock()
+    @diskDecorator()
+    def free_space_index(self):
+        """
+        Returns the FreeSpaceIndex of the free space outside the extended
+        partition. It is built from the layout snapshot and kept up to date
+        as partitions are added or deleted in memory::
+
+            from reparted import *
+
+            myDisk = Disk(Device("/dev/sdb"))
+            offset, grain = myDisk.device.get_alignment('optimal')
+            start, end = myDisk.free_space_index().best_fit(2048000, grain, offset)
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will return None.
+        """
+        if self._free_index is None:
+            extents = [e.geom[:2] for e in self.layout() if e.type == 4]
+            self._free_index = FreeSpaceIndex(extents)
+        return self._free_index
+
+    @diskLock()
+    @diskDecorator()
+    def layout(self):
+        """
+        Returns a snapshot of the partition table as a tuple of
+        LayoutEntry 6-tuples:
+
+            (num, type, geom, fs, name, part)
+
+        Where type is the raw libparted partition type, geom is the
+        (start, end, length) 3-tuple, fs and name are the filesystem type
+        and partition name (or None) and part is the ctypes ped_partition
+        pointer. Every node is included: normal, logical, extended,
+        free space and metadata.
+
+        The snapshot is built in a single walk of the partition list and
+        cached until the disk is modified through add_partition,
+        delete_partition, delete_all, set_label or a partition set_name.
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will return None.
+        """
+        if self._layout is None:
+            entries = []
+            names = self.type_features == 'PARTITION_NAME'
+            part = disk_next_partition(self._ped_disk, None)
+            while part:
+                c = part.contents
+                geom = (c.geom.start, c.geom.end, c.geom.length)
+                fs = c.fs_type.contents.name if c.fs_type else None
+                if names and c.type <= 2:
+                    name = partition_get_name(part)
+                else:
+                    name = None
+                entries.append(LayoutEntry(c.num, c.type, geom, fs, name, part))
+                part = disk_next_partition(self._ped_disk, part)
+            self._layout = tuple(entries)
+        return self._layout
+
+    @diskLock()
+    @diskDecorator()
+    def to_dict(self):
+        """
+        Returns the disk layout as a dict of plain values, ready to be
+        serialized (ie. with json or msgpack)::
+
+            {'device': {...}, 'type': 'gpt', 'partitions': [
+                {'num': 1, 'type': 'NORMAL', 'start': 2048, 'end': 1050623,
+                 'length': 1048576, 'fs': 'fat32', 'name': 'boot'}, ...]}
+
+        The device entry is Device.to_dict, partitions are listed in
+        address order and built from the layout snapshot.
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will return None.
+        """
+        partitions = [{'num': e.num, 'type': partition_type[e.type],
+                       'start': e.geom[0], 'end': e.geom[1], 'length': e.geom[2],
+                       'fs': e.fs, 'name': e.name}
+                      for e in self.layout() if e.type <= 2]
+        return {'device': self.device.to_dict(), 'type': self.type_name,
+                'partitions': partitions}
+
+    @diskLock()
     @diskDecorator()
     def free_partitions(self):
         """
@@ -191,17 +427,9 @@ class Disk(object):
             If the disk is initialized (no partition table) it
             will return None.
         """
-        partitions = []
-        part = disk_next_partition(self._ped_disk, None)
-        while part:
-            if part.contents.type != 4:
-                part = disk_next_partition(self._ped_disk, part)
-                continue
-            p = Partition(disk=self, part=part)
-            partitions.append(p)
-            part = disk_next_partition(self._ped_disk, part)
-        return partitions
+        return [Partition(disk=self, part=e.part) for e in self.layout() if e.type == 4]
 
+    @diskLock()
     @diskDecorator()
     def partitions(self):
         """
@@ -213,17 +441,9 @@ class Disk(object):
             will return None, if the disk has a partition table
             but no partitions it will return an empty list.
         """
-        partitions = []
-        part = disk_next_partition(self._ped_disk, None)
-        while part:
-            if part.contents.type > 2:
-                part = disk_next_partition(self._ped_disk, part)
-                continue
-            p = Partition(disk=self, part=part)
-            partitions.append(p)
-            part = disk_next_partition(self._ped_disk, part)
-        return partitions
+        return [Partition(disk=self, part=e.part) for e in self.layout() if e.type <= 2]
 
+    @diskLock(write=True)
     @diskDecorator(error=True)
     def add_partition(self, part):
         """
@@ -252,49 +472,299 @@ class Disk(object):
             If the disk is initialized (no partition table) it
             will raise DiskError.
         """
-        try:
-            p = self.get_partition(part.num)
-            if p.geom == part.geom:
-                raise AddPartitionError(701)
-        except ValueError:
-            pass
+        # New partitions are numbered -1, which is never in the index.
+        entry = self._partition_index()[0].get(part.num)
+        if entry is not None and entry.geom == part.geom:
+            raise AddPartitionError(701)
         partition = part._partition
         start, end, length = part.geom
         range_start = geometry_new(self._ped_device, start, 1)
         range_end = geometry_new(self._ped_device, end, 1)
         user_constraint = constraint_new(alignment_any, alignment_any, range_start,
-                                        range_end, 1, self._ped_device.contents.length)
+                                        range_end, 1, self.device.length)
+        geometry_destroy(range_start)
+        geometry_destroy(range_end)
         if not bool(user_constraint):
             raise AddPartitionError(702)
-        if part.alignment == 'optimal':
-            dev_constraint = device_get_optimal_aligned_constraint(self._ped_device)
-        elif part.alignment == 'minimal':
-            dev_constraint = device_get_minimal_aligned_constraint(self._ped_device)
-        else:
-            dev_constraint = device_get_constraint(self._ped_device)
+        dev_constraint = self.device._get_constraint(part.alignment)
         if not bool(dev_constraint):
+            constraint_destroy(user_constraint)
             raise AddPartitionError(702)
         final_constraint = constraint_intersect(user_constraint, dev_constraint)
         constraint_destroy(user_constraint)
-        constraint_destroy(dev_constraint)
         if not bool(final_constraint):
             raise AddPartitionError(703)
         added = disk_add_partition(self._ped_disk, partition, final_constraint)
         constraint_destroy(final_constraint)
         if not added:
+            self._invalidate()
             disk_remove_partition(self._ped_disk, partition)
             raise AddPartitionError(701)
-        if part.name:
-            set_name = partition_set_name(partition, part.name)
-            if not set_name:
-                disk_remove_partition(self._ped_disk, partition)
-                raise AddPartitionError(704)
+        if part.name and not partition_set_name(partition, part.name):
+            # Still owned by part, which destroys it once removed.
+            disk_remove_partition(self._ped_disk, partition)
+            self._invalidate()
+            raise AddPartitionError(704)
+        part._owned[0] = None
+        self._invalidate(self._extent(partition))
+
+    @diskLock(write=True)
+    @diskDecorator(error=True)
+    def apply_layout(self, specs, align='optimal', mode='full'):
+        """
+        Adds several partitions to disk and commits once. The geometries
+        are computed in a single pass over the free space, placing each
+        partition at the first aligned free sector it fits in, in the order
+        given::
+
+            from reparted import *
+
+            myDevice = Device("/dev/sdb")
+            myDisk = Disk(myDevice)
+            myDisk.apply_layout([
+                (Size(512, "MB"), 'NORMAL', 'fat32', 'boot', ['BOOT']),
+                (Size(4, "GB"), 'NORMAL', 'linux-swap', 'swap'),
+                (50, 'NORMAL', 'ext4', 'root', {'LVM': True}),
+            ])
+
+        Each spec is a (size, type, fs, name, flags) tuple or a dict with
+        those keys, only size is required. Size is either a Size instance,
+        a percent of the usable device space, or a reparted.planner.Weight
+        (None or FILL for the rest of the space), see DiskModel.plan. Flags
+        is either a list of flags to set or a dict of flag states.
+
+        *Args:*
+
+        *       specs (list):   The partition specs.
+        *       align (str):    The partition alignment, 'minimal' or 'optimal'.
+        *       mode (str):     The commit mode, see commit.
+
+        *Raises:*
+
+        *       PartitionError, AddPartitionError, DiskCommitError
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will raise DiskError. Nothing is written if any of the
+            partitions fails to be added.
+        """
+        specs = [layout_spec(spec) for spec in specs]
+        planned = self._plan_layout(specs, align)
+        constraint = self.device._get_constraint(align)
+        if not bool(constraint):
+            raise AddPartitionError(703)
+        parts = []
+        with self.transaction(mode):
+            for spec, (start, end) in zip(specs, planned):
+                parts.append(self._add_spec(spec, start, end, constraint))
+        return [Partition(disk=self, part=part) for part in parts]
+
+    def _spec_sectors(self, size, align='optimal'):
+        model = DiskModel.from_device(self.device, self.type_name, align)
+        return model.spec_sectors(size)
+
+    def _plan_layout(self, specs, align):
+        result = DiskModel.from_disk(self, align).plan(specs)
+        if result.errors:
+            raise result.errors[0][1]
+        return [geom[:2] for geom in result.geoms]
+
+    def _add_spec(self, spec, start, end, constraint):
+        if spec.fs and spec.type != 'EXTENDED':
+            filesystem = file_system_type_get(spec.fs)
+        else:
+            filesystem = None
+        code = partition_type_code[spec.type]
+        part = partition_new(self._ped_disk, code, filesystem, start, end)
+        if not bool(part):
+            raise PartitionError(700)
+        added = disk_add_partition(self._ped_disk, part, constraint)
+        if not added:
+            partition_destroy(part)
+            self._invalidate()
+            raise AddPartitionError(701)
+        self._invalidate(self._extent(part))
+        if spec.name and not partition_set_name(part, spec.name):
+            raise AddPartitionError(704)
+        available = self._available_flags(part)
+        for flag, state in spec.flags:
+            if flag not in available:
+                raise PartitionError(710)
+            partition_set_flag(part, partition_flag[flag], int(state))
+        return part
+
+    def _available_flags(self, part):
+        """
+        Returns the set of flag names available for the ctypes ped_partition,
+        libparted is only asked once per disk label and partition type.
+        """
+        key = (self.type_name, part.contents.type)
+        available = flag_availability.get(key)
+        if available is None:
+            available = frozenset(flag for flag, code in partition_flag.items()
+                                  if partition_is_flag_available(part, code))
+            flag_availability[key] = available
+        return available
+
+    @diskLock()
+    @diskDecorator(error=True)
+    def diff(self, specs, align='optimal'):
+        """
+        Returns the list of operations needed to turn the current partition
+        table into the desired layout, empty if the disk already matches.
+        The specs are the same as apply_layout takes and are matched, in order,
+        with the current partitions in address order. Each operation is a
+        DiffOperation 3-tuple:
+
+            (action, num, value)
+
+        Where action is one of:
+
+        *   delete:     Delete partition num.
+        *   resize:     Move the end of partition num, value is the new (start, end).
+        *   rename:     Set the name of partition num to value.
+        *   flag:       Set a flag of partition num, value is the (flag, state).
+        *   add:        Add a new partition, value is the LayoutSpec.
+
+        Use apply to carry out the operations::
+
+            from reparted import *
+
+            myDisk = Disk(Device("/dev/sdb"))
+            specs = [(Size(512, "MB"), 'NORMAL', 'fat32', 'boot', ['BOOT']),
+                     (90, 'NORMAL', 'ext4', 'root')]
+            myDisk.apply(myDisk.diff(specs))
+
+        Sizes within one alignment grain of the desired size are considered
+        equal and weighted sizes are not compared, an empty name leaves the
+        current name as it is and only the flags listed in a spec are compared.
+
+        *Args:*
+
+        *       specs (list):   The desired partition specs.
+        *       align (str):    The partition alignment, 'minimal' or 'optimal'.
+
+        *Raises:*
+
+        *       PartitionError
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will raise DiskError.
+        """
+        specs = [layout_spec(spec) for spec in specs]
+        offset, grain = self.device.get_alignment(align) or (0, 1)
+        names = self.type_features == 'PARTITION_NAME'
+        current = [e for e in self.layout() if e.type <= 2]
+        ops = []
+        adds = []
+        # Deleting the extended partition deletes its logical partitions,
+        # no operation may refer to them afterwards.
+        dropped = False
+        for i, spec in enumerate(specs):
+            if i >= len(current):
+                adds.append(DiffOperation('add', None, spec))
+                continue
+            entry = current[i]
+            if entry.type == 1 and dropped:
+                adds.append(DiffOperation('add', None, spec))
+                continue
+            if partition_type[entry.type] != spec.type:
+                ops.append(DiffOperation('delete', entry.num, None))
+                adds.append(DiffOperation('add', None, spec))
+                dropped = dropped or entry.type == 2
+                continue
+            start, end, length = entry.geom
+            sectors = self._spec_sectors(spec.size, align)
+            if sectors is not None and abs(sectors - length) >= grain:
+                ops.append(DiffOperation('resize', entry.num, (start, start + sectors - 1)))
+            if names and spec.name and partition_get_name(entry.part) != spec.name:
+                ops.append(DiffOperation('rename', entry.num, spec.name))
+            for flag, state in spec.flags:
+                if flag not in partition_flag:
+                    raise PartitionError(710)
+                if bool(partition_get_flag(entry.part, partition_flag[flag])) != bool(state):
+                    ops.append(DiffOperation('flag', entry.num, (flag, bool(state))))
+        extra = current[len(specs):]
+        if [e for e in extra if e.type == 2]:
+            dropped = True
+        for entry in reversed(extra):
+            if not (entry.type == 1 and dropped):
+                ops.append(DiffOperation('delete', entry.num, None))
+        # Logical partitions go first, highest number first.
+        deletes = sorted([op for op in ops if op.action == 'delete'],
+                         key=lambda op: -op.num)
+        return deletes + [op for op in ops if op.action != 'delete'] + adds
+
+    @diskLock(write=True)
+    @diskDecorator(error=True)
+    def apply(self, diff, align='optimal', mode='full'):
+        """
+        Carries out the operations returned by diff within a transaction,
+        so the table is committed once. If there are no operations nothing
+        is written or committed.
+
+        *Args:*
+
+        *       diff (list):    The DiffOperation list returned by diff.
+        *       align (str):    The partition alignment, 'minimal' or 'optimal'.
+        *       mode (str):     The commit mode, see commit.
+
+        *Raises:*
 
+        *       PartitionError, AddPartitionError, DeletePartitionError,
+                DiskCommitError
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will raise DiskError.
+        """
+        if not diff:
+            return
+        # Resolve partitions up front, deletes renumber logical partitions.
+        parts = dict((op.num, self._get_ped_partition(op.num))
+                     for op in diff if op.num is not None)
+        adds = [op.value for op in diff if op.action == 'add']
+        constraint = self.device._get_constraint(align)
+        if not bool(constraint):
+            raise AddPartitionError(703)
+        with self.transaction(mode):
+            for op in diff:
+                part = parts.get(op.num)
+                if op.action == 'delete':
+                    if partition_is_busy(part):
+                        raise DeletePartitionError(706)
+                    disk_delete_partition(self._ped_disk, part)
+                    self._invalidate()
+                elif op.action == 'resize':
+                    start, end = op.value
+                    if not disk_set_partition_geom(self._ped_disk, part, constraint, start, end):
+                        raise AddPartitionError(715)
+                    self._invalidate()
+                elif op.action == 'rename':
+                    if not partition_set_name(part, op.value):
+                        raise AddPartitionError(704)
+                    self._names_changed()
+                elif op.action == 'flag':
+                    flag, state = op.value
+                    if flag not in self._available_flags(part):
+                        raise PartitionError(710)
+                    partition_set_flag(part, partition_flag[flag], int(state))
+            if adds:
+                planned = self._plan_layout(adds, align)
+                for spec, (start, end) in zip(adds, planned):
+                    self._add_spec(spec, start, end, constraint)
+
+    @diskLock(write=True)
     @diskDecorator(error=True)
     def delete_partition(self, part):
         """
         Deletes a partition from disk. Unlike add_partition,
-        this method calls commit, use carefully::
+        this method calls commit (unless called within a transaction),
+        use carefully::
 
             from reparted import *
 
@@ -330,11 +800,15 @@ class Disk(object):
             raise DeletePartitionError(705)
         if partition_is_busy(partition):
             raise DeletePartitionError(706)
+        extent = self._extent(partition)
         disk_delete_partition(self._ped_disk, partition)
+        self._invalidate(extent, released=True)
+        if self._transaction:
+            return
         self.commit()
-        disk_destroy(self._ped_disk)
-        self._disk = disk_new(self._ped_device)
+        self.reload()
 
+    @diskLock(write=True)
     @diskDecorator()
     def delete_all(self):
         """
@@ -350,12 +824,111 @@ class Disk(object):
             will return None.
         """
         disk_delete_all(self._ped_disk)
+        self._invalidate()
         return
 
     @diskDecorator(error=True)
-    def commit(self):
+    def transaction(self, mode='full'):
         """
-        This method commits partition modifications to disk.
+        Returns a context manager that batches partition table changes.
+        Adds, deletes, flag and name changes made within the block are
+        applied to the in-memory table only and committed once, in the
+        given commit mode, when the block exits::
+
+            from reparted import *
+
+            myDevice = Device("/dev/sdb")
+            myDisk = Disk(myDevice)
+
+            with myDisk.transaction():
+                # Logical partitions first, the extended one frees them.
+                for part in reversed(myDisk.partitions()):
+                    myDisk.delete_partition(part)
+                myDisk.add_partition(Partition(myDisk, Size(4, "GB")))
+
+        If any step within the block (including the final commit) raises,
+        the in-memory table is rolled back to its state before the block
+        and the exception is propagated. If the table was already written
+        to the device (the kernel re-read failed) it is kept instead, so
+        memory and device agree. Nested transactions join the outermost one.
+
+        A rollback replaces the in-memory table with the copy taken when
+        the block started, so every Partition instance obtained from the
+        disk before or within the block is invalid afterwards (it refers
+        to freed memory), get them again from partitions or get_partition.
+
+        *Raises:*
+
+        *       DiskError, DiskCommitError
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will raise DiskError. set_label is unavailable within
+            a transaction.
+        """
+        if mode not in commit_modes:
+            raise DiskError(609)
+        return self._transaction_context(mode)
+
+    @contextmanager
+    def _transaction_context(self, mode):
+        with self._lock.writing():
+            if self._transaction:
+                yield self
+                return
+            backup = disk_duplicate(self._ped_disk)
+            if not bool(backup):
+                raise DiskError(607)
+            self._transaction = True
+            written = self._commit_generation
+            try:
+                yield self
+                self._transaction = False
+                self.commit(mode)
+            except:
+                self._transaction = False
+                if self._commit_generation != written:
+                    # The new table is on the device, rolling back would
+                    # have the next commit write the old one back.
+                    disk_destroy(backup)
+                    raise
+                self._destroy_disk()
+                self._disk = backup
+                self._invalidate()
+                raise
+            disk_destroy(backup)
+
+    @diskLock(write=True)
+    @diskDecorator(error=True)
+    def commit(self, mode='full'):
+        """
+        This method commits partition modifications to disk. Within a
+        transaction this is a no-op, the transaction commits on exit.
+
+        The mode selects the steps taken:
+
+        *   full:       Write the table to the device and have the kernel re-read it.
+        *   device:     Only write the table to the device.
+        *   os:         Only have the kernel re-read the table.
+        *   deferred:   Write the table to the device and queue the kernel
+                        re-read until commit_deferred is called, so many disks
+                        can be re-read in a single final step::
+
+            from reparted import *
+            from reparted.disk import commit_deferred
+
+            for disk in disks:
+                disk.apply_layout(specs)   # commits in full mode
+                disk.delete_partition(1)
+                disk.commit(mode='deferred')
+            commit_deferred()
+
+        For image files (device type 'FILE') the kernel is never notified.
+
+        *Args:*
+
+        *       mode (str):     The commit mode ('full', 'device', 'os' or 'deferred').
 
         *Raises:*
 
@@ -366,9 +939,26 @@ class Disk(object):
             If the disk is initialized (no partition table) it
             will return None.
         """
-        to_dev = disk_commit_to_dev(self._ped_disk)
-        if not to_dev:
-            raise DiskCommitError(601)
+        if mode not in commit_modes:
+            raise DiskError(609)
+        if self._transaction:
+            return
+        if mode != 'os':
+            to_dev = disk_commit_to_dev(self._ped_disk)
+            if not to_dev:
+                raise DiskCommitError(601)
+            path = self.device.path
+            commit_generation[path] = commit_generation.get(path, 0) + 1
+            self._commit_generation = commit_generation[path]
+            # New partitions have their GUIDs on the device now.
+            self._guids = None
+        if mode == 'device' or self.device.type == 'FILE':
+            # Image files have no kernel partition table to update.
+            return
+        if mode == 'deferred':
+            deferred_disks[self.device.path] = self
+            return
+        deferred_disks.pop(self.device.path, None)
         to_os = disk_commit_to_os(self._ped_disk)
         if not to_os:
             raise DiskCommitError(602)
@@ -379,10 +969,12 @@ class Disk(object):
             raise PartitionError(705)
         return partition
 
+    @diskLock()
     @diskDecorator(error=True)
     def get_partition(self, part_num):
         """
-        Returns a Partition instance.
+        Returns a Partition instance. The same instance is returned for
+        a partition number until the partition table changes.
 
         *Args:*
 
@@ -397,10 +989,203 @@ class Disk(object):
             If the disk is initialized (no partition table) it
             will raise DiskError.
         """
-        partition = Partition(disk=self, part=self._get_ped_partition(part_num))
+        entry = self._partition_index()[0].get(part_num)
+        if entry is None:
+            raise PartitionError(705)
+        return self._wrap(entry)
+
+    def _partition_index(self):
+        """
+        Returns the (by_num, by_name, wrappers) dicts of the partitions,
+        built from the layout snapshot and dropped along with it.
+        """
+        if self._index is None:
+            entries = [e for e in self.layout() if e.type <= 2]
+            by_num = dict((e.num, e) for e in entries)
+            # The first partition in address order wins duplicate names.
+            by_name = dict((e.name, e) for e in reversed(entries) if e.name)
+            self._index = (by_num, by_name, {})
+        return self._index
+
+    def _partition_guids(self):
+        """
+        Returns a dict of the partitions by GUID, read from the gpt table on
+        the device. Partitions not committed yet are left out.
+        """
+        if self._guids is None:
+            guids = {}
+            if self.type_name == 'gpt':
+                by_num = self._partition_index()[0]
+                result = scan(self.device.path, self.device.sector_size)
+                for p in result.partitions:
+                    entry = by_num.get(p.num)
+                    if entry is not None and entry.geom[0] == p.geom[0]:
+                        guids[p.guid] = entry
+            self._guids = guids
+        return self._guids
+
+    def _wrap(self, entry):
+        wrappers = self._partition_index()[2]
+        partition = wrappers.get(entry.num)
+        if partition is None:
+            partition = wrappers[entry.num] = Partition(disk=self, part=entry.part)
         return partition
 
+    @diskLock()
+    @diskDecorator(error=True)
+    def find_partition(self, name=None, guid=None):
+        """
+        Returns the Partition with the given name or GUID, or None if
+        there is no such partition::
+
+            from reparted import *
+
+            myDisk = Disk(Device("/dev/sdb"))
+            root = myDisk.find_partition(name="root")
+            boot = myDisk.find_partition(guid="0fc63daf-8483-4772-8e79-3d69d8477de4")
+
+        Lookups use an index built on first use from the layout snapshot and
+        kept until the table changes. GUIDs are read from the device once per
+        commit, so only committed partitions on gpt disks have them.
+
+        *Args:*
+
+        *       name (str):     The partition name.
+        *       guid (str):     The partition GUID.
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will raise DiskError. If several partitions have the same
+            name the first one on disk is returned.
+        """
+        if name is not None:
+            entry = self._partition_index()[1].get(name)
+        elif guid is not None:
+            entry = self._partition_guids().get(guid.lower())
+        else:
+            entry = None
+        if entry is None:
+            return None
+        return self._wrap(entry)
+
+    @diskLock(write=True)
+    @diskDecorator(error=True)
+    def set_flags(self, flags, mode='full'):
+        """
+        Sets the flags of several partitions and commits once. All the
+        flags are checked before any is set::
+
+            from reparted import *
+
+            myDisk = Disk(Device("/dev/sdb"))
+            myDisk.set_flags({1: {'BOOT': True}, 2: {'LVM': True, 'RAID': False}})
+
+        *Args:*
+
+        *       flags (dict):   The {flag: state} dict of each partition number.
+        *       mode (str):     The commit mode, see commit.
+
+        *Raises:*
+
+        *       PartitionError, DiskCommitError
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will raise DiskError. Within a transaction the changes
+            are committed with it.
+        """
+        by_num = self._partition_index()[0]
+        changes = []
+        for num, states in flags.items():
+            entry = by_num.get(num)
+            if entry is None:
+                raise PartitionError(705)
+            available = self._available_flags(entry.part)
+            for flag, state in states.items():
+                if flag not in available:
+                    raise PartitionError(710)
+                changes.append((entry.part, partition_flag[flag], int(state)))
+        if not changes:
+            return
+        with self.transaction(mode):
+            for part, code, state in changes:
+                partition_set_flag(part, code, state)
+
+    @diskLock(write=True)
+    @diskDecorator(error=True)
+    def set_names(self, names, mode='full'):
+        """
+        Sets the names of several partitions and commits once. Partitions
+        that already have the name are left as they are::
+
+            from reparted import *
+
+            myDisk = Disk(Device("/dev/sdb"))
+            myDisk.set_names({1: 'boot', 2: 'root', 3: 'home'})
+
+        *Args:*
+
+        *       names (dict):   The name of each partition number.
+        *       mode (str):     The commit mode, see commit.
+
+        *Raises:*
+
+        *       NotImplementedError, PartitionError, DiskCommitError
+
+        .. note::
+
+            If the disk is initialized (no partition table) it
+            will raise DiskError. Within a transaction the changes
+            are committed with it.
+        """
+        if self.type_features != 'PARTITION_NAME':
+            raise NotImplementedError("The disk does not support partition names.")
+        by_num = self._partition_index()[0]
+        changes = []
+        for num, name in names.items():
+            entry = by_num.get(num)
+            if entry is None:
+                raise PartitionError(705)
+            if entry.name != name:
+                changes.append((entry.part, name))
+        if not changes:
+            return
+        with self.transaction(mode):
+            for part, name in changes:
+                if not partition_set_name(part, name):
+                    raise PartitionError(704)
+            self._names_changed()
+
+    @diskLock(write=True)
+    def reload(self):
+        """
+        Discards the in-memory partition table and reads it again from
+        the device. Partition instances obtained before are no longer valid.
+
+        *Raises:*
+
+        *       DiskError
+        """
+        if bool(self._ped_disk):
+            self._destroy_disk()
+        self._disk = disk_new(self._ped_device)
+        self._commit_generation = commit_generation.get(self.device.path, 0)
+        self._invalidate()
+        if not bool(self._disk):
+            raise DiskError(600)
+
+    @property
+    def stale(self):
+        """
+        Returns True if another Disk instance committed to the device since
+        this one read or committed the partition table.
+        """
+        return self._commit_generation != commit_generation.get(self.device.path, 0)
+
     def _destroy_disk(self, disk=None):
+        release_partitions(self._pending)
         if disk:
             disk_destroy(disk)
         else:
@@ -410,6 +1195,7 @@ class Disk(object):
             else:
                 raise DiskError(600)
 
+    @diskLock(write=True)
     def set_label(self, label):
         """
         Sets the disk partition table ('gpt' or 'msdos)'.
@@ -423,6 +1209,8 @@ class Disk(object):
 
         *       DiskError
         """
+        if self._transaction:
+            raise DiskError(608)
         if label not in disk_labels:
             raise DiskError(603)
         disk_type = disk_get_type(label)
@@ -430,10 +1218,61 @@ class Disk(object):
             raise DiskError(604)
         if bool(self._ped_disk):
             self._destroy_disk()
+        self._invalidate()
         new_disk = disk_new_fresh(self._ped_device, disk_type)
         if not bool(new_disk):
             raise DiskError(605)
         self._disk = new_disk
         self.commit()
         self._destroy_disk(disk=new_disk)
-        self._disk = disk_new(self._ped_device)
\ No newline at end of file
+        self._disk = disk_new(self._ped_device)
+        self._invalidate()
+
+def release_partitions(pending):
+    for holder in pending:
+        if holder[0]:
+            partition_destroy(holder[0])
+            holder[0] = None
+    del pending[:]
+
+def release_disk(owned, pending, dev):
+    release_partitions(pending)
+    if owned[0]:
+        disk_destroy(owned[0])
+        owned[0] = None
+    release_device(dev, {})
+
+def commit_deferred():
+    """
+    This function has the kernel re-read the partition table of every
+    disk committed in 'deferred' mode, once per device, and returns a
+    list of the disks that failed.
+    """
+    failed = []
+    while deferred_disks:
+        path, disk = deferred_disks.popitem()
+        with disk._lock.writing():
+            if not bool(disk._ped_disk) or not disk_commit_to_os(disk._ped_disk):
+                failed.append(disk)
+    return failed
+
+def export_layouts(disks, fp):
+    """
+    This function writes the layout of each disk to the file object fp
+    as JSON lines, one Disk.to_dict object per line, as the disks are
+    iterated::
+
+        from reparted import *
+        from reparted.disk import export_layouts
+
+        with open("layouts.jsonl", "w") as fp:
+            export_layouts((Disk(Device(path)) for path in paths), fp)
+
+    Disks without a partition table are written with the device only.
+    """
+    for disk in disks:
+        layout = disk.to_dict()
+        if layout is None:
+            layout = {'device': disk.device.to_dict(), 'type': None, 'partitions': []}
+        fp.write(json.dumps(layout, sort_keys=True))
+        fp.write('\n')
@@ -15,7 +15,8 @@ size_error_code = {
 }
 
 device_error_code = {
-    500: "No device found."
+    500: "No device found.",
+    501: "Invalid alignment option."
 }
 
 disk_error_code = {
@@ -25,7 +26,10 @@ disk_error_code = {
     603: "Unsupported disk label.",
     604: "Failed to get disk type.",
     605: "Failed to create new disk.",
-    606: "Method unavailable for initialized disk."
+    606: "Method unavailable for initialized disk.",
+    607: "Failed to start transaction.",
+    608: "Method unavailable during a transaction.",
+    609: "Invalid commit mode."
 }
 
 partition_error_code = {
@@ -43,7 +47,8 @@ partition_error_code = {
     711: "Partition type not supported by disk.",
     712: "Partition is outside disk.",
     713: "No extended partition found on disk.",
-    714: "Only one extended partition is allowed per disk."
+    714: "Only one extended partition is allowed per disk.",
+    715: "Failed to resize partition."
 }
 
 class SizeError(RepartedError):
@@ -62,6 +67,7 @@ class DeviceError(RepartedError):
     Raised when a Device class error occurs for the following reasons:
 
     *       *No device found.*
+    *       *Invalid alignment option.*
 
     """
     def __init__(self, code):
@@ -76,6 +82,9 @@ class DiskError(RepartedError):
     *       *Failed to get disk type.*
     *       *Failed to create new disk.*
     *       *Method unavailable for initialized disk.*
+    *       *Failed to start transaction.*
+    *       *Method unavailable during a transaction.*
+    *       *Invalid commit mode.*
 
     """
     def __init__(self, code):
@@ -116,6 +125,7 @@ class AddPartitionError(RepartedError):
     *       *Failed to set user-defined constraint to disk.*
     *       *Failed to set device constraint to disk.*
     *       *Failed to set partition name to disk.*
+    *       *Failed to resize partition.*
 
     """
     def __init__(self, code):
@@ -0,0 +1,316 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from bisect import bisect_left, bisect_right, insort
+import random
+
+def align_up(sector, grain, offset):
+    """
+    Returns the first sector at or after sector that falls on the
+    given grain and offset.
+    """
+    return sector + ((offset - sector) % grain)
+
+class _Node(object):
+    """
+    A treap node of a free extent, keyed by start sector and augmented
+    with the longest extent length in its subtree.
+    """
+    __slots__ = ('start', 'end', 'priority', 'left', 'right', 'longest')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.longest = end - start + 1
+
+def _update(node):
+    longest = node.end - node.start + 1
+    if node.left is not None and node.left.longest > longest:
+        longest = node.left.longest
+    if node.right is not None and node.right.longest > longest:
+        longest = node.right.longest
+    node.longest = longest
+    return node
+
+def _split(node, start):
+    """
+    Splits a treap into the nodes before start and those at or after it.
+    """
+    if node is None:
+        return (None, None)
+    if node.start < start:
+        node.right, after = _split(node.right, start)
+        return (_update(node), after)
+    before, node.left = _split(node.left, start)
+    return (before, _update(node))
+
+def _merge(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.priority > b.priority:
+        a.right = _merge(a.right, b)
+        return _update(a)
+    b.left = _merge(a, b.left)
+    return _update(b)
+
+def _build(extents):
+    """
+    Builds a treap of sorted, disjoint extents in linear time, keeping
+    the right spine on a stack.
+    """
+    spine = []
+    for start, end in extents:
+        node = _Node(start, end)
+        last = None
+        while spine and spine[-1].priority < node.priority:
+            last = _update(spine.pop())
+        node.left = last
+        if spine:
+            spine[-1].right = node
+        spine.append(node)
+    for node in reversed(spine):
+        _update(node)
+    return spine[0] if spine else None
+
+def _first_long(node, after, length):
+    """
+    Returns the lowest addressed node starting after sector after that is
+    at least length sectors long, skipping subtrees too short to hold one.
+    """
+    while node is not None and node.longest >= length:
+        if node.start <= after:
+            node = node.right
+            continue
+        found = _first_long(node.left, after, length)
+        if found is not None:
+            return found
+        if node.end - node.start + 1 >= length:
+            return node
+        node = node.right
+    return None
+
+class FreeSpaceIndex(object):
+    """
+    *FreeSpaceIndex class keeps the free extents of a disk sorted by
+    address and by length.*
+
+    Extents are (start, end) 2-tuples in sectors, both inclusive. Lookups
+    take the requested length in sectors and optionally the alignment
+    grain and offset the start sector must fall on, and return the aligned
+    (start, end) of the allocation or None if nothing fits::
+
+        from reparted.freespace import FreeSpaceIndex
+
+        index = FreeSpaceIndex([(34, 2047), (206848, 4194270)])
+        index.best_fit(204800, grain=2048)
+        (206848, 411647)
+
+    Best fit, largest fit, first fit and address lookups are O(log n)
+    searches. First fit walks a treap in address order that keeps the
+    longest extent of each subtree, so runs of extents too short for the
+    request are skipped whole. Adding and allocating extents keep every
+    order up to date in place.
+
+    *Args:*
+
+    *   extents (list):     The initial (start, end) free extents.
+    """
+    def __init__(self, extents=()):
+        merged = []
+        for start, end in sorted(extents):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self._starts = [start for start, end in merged]
+        self._ends = dict(merged)
+        self._lengths = sorted((end - start + 1, start) for start, end in merged)
+        self._root = _build(merged)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __iter__(self):
+        """
+        Iterates over the free extents in address order.
+        """
+        for start in self._starts:
+            yield (start, self._ends[start])
+
+    def _insert(self, start, end):
+        insort(self._starts, start)
+        self._ends[start] = end
+        insort(self._lengths, (end - start + 1, start))
+        before, after = _split(self._root, start)
+        self._root = _merge(_merge(before, _Node(start, end)), after)
+
+    def _remove(self, start):
+        end = self._ends.pop(start)
+        del self._starts[bisect_left(self._starts, start)]
+        del self._lengths[bisect_left(self._lengths, (end - start + 1, start))]
+        before, rest = _split(self._root, start)
+        node, after = _split(rest, start + 1)
+        self._root = _merge(before, after)
+        return end
+
+    def _resize(self, i, start, end):
+        """
+        Trims the i-th extent to (start, end) in place, it keeps its
+        place in address order.
+        """
+        old = self._starts[i]
+        old_end = self._ends.pop(old)
+        del self._lengths[bisect_left(self._lengths, (old_end - old + 1, old))]
+        self._starts[i] = start
+        self._ends[start] = end
+        insort(self._lengths, (end - start + 1, start))
+        path = []
+        node = self._root
+        while node.start != old:
+            path.append(node)
+            node = node.left if old < node.start else node.right
+        node.start = start
+        node.end = end
+        _update(node)
+        for node in reversed(path):
+            _update(node)
+
+    def _fit(self, start, end, sectors, grain, offset, lead=0):
+        s = align_up(start + lead, grain, offset)
+        if s + sectors - 1 <= end:
+            return (s, s + sectors - 1)
+        return None
+
+    @property
+    def total(self):
+        """
+        Returns the total free sectors.
+        """
+        return sum(length for length, start in self._lengths)
+
+    def largest(self):
+        """
+        Returns the largest free extent or None if there is no free space.
+        """
+        if not self._lengths:
+            return None
+        length, start = self._lengths[-1]
+        return (start, self._ends[start])
+
+    def find(self, sector):
+        """
+        Returns the free extent containing sector, or the next one after
+        it, or None.
+        """
+        i = bisect_right(self._starts, sector) - 1
+        if i >= 0 and self._ends[self._starts[i]] >= sector:
+            start = self._starts[i]
+        elif i + 1 < len(self._starts):
+            start = self._starts[i + 1]
+        else:
+            return None
+        return (start, self._ends[start])
+
+    def best_fit(self, sectors, grain=1, offset=0):
+        """
+        Returns the allocation in the smallest extent that fits.
+        """
+        for i in range(bisect_left(self._lengths, (sectors,)), len(self._lengths)):
+            start = self._lengths[i][1]
+            fit = self._fit(start, self._ends[start], sectors, grain, offset)
+            if fit:
+                return fit
+        return None
+
+    def largest_fit(self, sectors, grain=1, offset=0):
+        """
+        Returns the allocation at the start of the largest extent, if it fits.
+        """
+        extent = self.largest()
+        if extent is None:
+            return None
+        return self._fit(extent[0], extent[1], sectors, grain, offset)
+
+    def first_fit(self, sectors, grain=1, offset=0, after=0, lead=0):
+        """
+        Returns the allocation in the lowest addressed extent that fits,
+        starting the search at sector after. Lead sectors are left free
+        in front of the allocation (ie. 1 for the EBR of a logical
+        partition).
+
+        .. note::
+
+            An extent at least sectors + lead long may still not fit once
+            its start is aligned, the search then goes on past it. Only
+            extents less than a grain longer than that can fail this way.
+        """
+        extent = self.find(after)
+        if extent is None:
+            return None
+        start, end = extent
+        fit = self._fit(max(start, after), end, sectors, grain, offset, lead)
+        while fit is None:
+            node = _first_long(self._root, start, sectors + lead)
+            if node is None:
+                return None
+            start = node.start
+            fit = self._fit(start, node.end, sectors, grain, offset, lead)
+        return fit
+
+    def add(self, start, end):
+        """
+        Marks the (start, end) range as free, merging it with the
+        neighbouring extents.
+        """
+        i = bisect_left(self._starts, start)
+        if i > 0:
+            prev = self._starts[i - 1]
+            if self._ends[prev] >= start - 1:
+                start = prev
+                end = max(end, self._remove(prev))
+        while True:
+            i = bisect_left(self._starts, start)
+            if i >= len(self._starts) or self._starts[i] > end + 1:
+                break
+            end = max(end, self._remove(self._starts[i]))
+        self._insert(start, end)
+
+    def allocate(self, start, end):
+        """
+        Marks the (start, end) range as used, splitting the free extents
+        it overlaps.
+        """
+        i = bisect_right(self._starts, end) - 1
+        while i >= 0:
+            s = self._starts[i]
+            e = self._ends[s]
+            if e < start:
+                break
+            if s < start and e > end:
+                self._remove(s)
+                self._insert(s, start - 1)
+                self._insert(end + 1, e)
+            elif s < start:
+                self._resize(i, s, start - 1)
+            elif e > end:
+                self._resize(i, end + 1, e)
+            else:
+                self._remove(s)
+            i = bisect_right(self._starts, end, 0, i) - 1
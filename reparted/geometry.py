@@ -0,0 +1,110 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from freespace import align_up
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def align_start(start, grain, offset=0):
+    """
+    Returns the start sector a new partition is created at, as done by
+    Partition: start is kept if it is on the grain and offset, otherwise
+    it moves up to the next sector that is.
+    """
+    return align_up(start, grain, offset)
+
+def align_end(start, length, grain, offset=0):
+    """
+    Returns the end sector a new partition of length sectors starting at
+    start is created with, as done by Partition: the last sector is kept
+    if it is on the grain and offset, otherwise it moves down to the
+    previous sector that is, unless that is before start.
+    """
+    end = start + length - 1
+    aligned = end - ((end - offset) % grain)
+    if aligned < start:
+        # Shorter than a grain, rather than aligned to nothing.
+        return end
+    return aligned
+
+def _align_python(starts, lengths, grain, offset, end_grain, end_offset, first, last):
+    a_starts = []
+    a_ends = []
+    valid = []
+    for start, length in zip(starts, lengths):
+        start = align_start(start, grain, offset)
+        end = align_end(start, length, end_grain, end_offset)
+        a_starts.append(start)
+        a_ends.append(end)
+        valid.append(length > 0 and start >= first and start <= end and
+                     (last is None or end <= last))
+    return a_starts, a_ends, valid
+
+def _align_numpy(starts, lengths, grain, offset, end_grain, end_offset, first, last):
+    starts = numpy.asarray(starts, dtype=numpy.int64)
+    lengths = numpy.asarray(lengths, dtype=numpy.int64)
+    a_starts = starts + (offset - starts) % grain
+    ends = a_starts + lengths - 1
+    a_ends = ends - (ends - end_offset) % end_grain
+    a_ends = numpy.where(a_ends < a_starts, ends, a_ends)
+    valid = (lengths > 0) & (a_starts >= first) & (a_starts <= a_ends)
+    if last is not None:
+        valid &= a_ends <= last
+    return a_starts, a_ends, valid
+
+def align_batch(starts, lengths, grain, offset=0, end_grain=None, end_offset=None,
+                first=0, last=None):
+    """
+    This function aligns many candidate partitions at once, the same way
+    Partition aligns a single new partition, and returns a 3-tuple:
+
+        (starts, ends, valid)
+
+    Where starts and ends are the aligned start and end sectors and valid
+    is True for each candidate with a positive length that lies within
+    first and last. With NumPy installed the inputs can be any sequence
+    or array and NumPy arrays are returned, otherwise lists are returned::
+
+        from reparted.geometry import align_batch
+
+        offset, grain = myDevice.get_alignment('optimal')
+        starts, ends, valid = align_batch(candidate_starts, candidate_lengths,
+                                          grain, offset, last=myDevice.length - 1)
+
+    *Args:*
+
+    *       starts:             The start sectors.
+    *       lengths:            The lengths in sectors.
+    *       grain (int):        The start alignment grain size in sectors.
+    *       offset (int):       The start alignment offset in sectors.
+    *       end_grain (int):    The end alignment grain size, by default grain.
+    *       end_offset (int):   The end alignment offset, by default the
+                                sector before an aligned start, as in
+                                libparted's aligned constraints.
+    *       first (int):        The first usable sector.
+    *       last (int):         The last usable sector, None for no limit.
+    """
+    if end_grain is None:
+        end_grain = grain
+    if end_offset is None:
+        end_offset = (offset - 1) % end_grain
+    if numpy is not None:
+        align = _align_numpy
+    else:
+        align = _align_python
+    return align(starts, lengths, grain, offset, end_grain, end_offset, first, last)
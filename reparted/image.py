@@ -0,0 +1,228 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from scan import scan_reader, gpt_header, gpt_signature
+import uuid
+import zlib
+import mmap
+import os
+
+# Offset of the disk signature in the MBR, part of msdos PARTUUIDs.
+mbr_disk_signature = 440
+
+def create_image(path, size):
+    """
+    This function creates a sparse image file of the given Size, no
+    blocks are allocated until they are written. The image can then be
+    used as a device::
+
+        from reparted import *
+        from reparted.image import create_image
+
+        create_image("/tmp/vm.img", Size(20, "GB"))
+        myDisk = Disk(Device("/tmp/vm.img"))
+        myDisk.set_label('gpt')
+
+    *Args:*
+
+    *       path (str):     The image path, an existing file is truncated.
+    *       size:           A Size class instance.
+    """
+    with open(path, 'wb') as f:
+        f.truncate(size.sectors * size.sector_size)
+    return path
+
+class Image(object):
+    """
+    *Image class memory-maps an image file to read and write its
+    partition table regions without per-sector system calls.*
+
+    The regions are 'mbr', 'gpt_header', 'gpt_entries', 'gpt_backup_header'
+    and 'gpt_backup_entries', the gpt ones are only available if the image
+    has a gpt label. A common use is stamping the table of a template image
+    on many new images of the same size, each getting its own disk and
+    partition GUIDs::
+
+        from reparted import *
+        from reparted.image import Image, create_image
+
+        with Image("/tmp/template.img") as template:
+            regions = template.read_regions()
+        for path in paths:
+            create_image(path, Size(20, "GB"))
+            with Image(path) as image:
+                image.write_regions(regions)
+
+    *Args:*
+
+    *   path (str):         The image path.
+    *   sector_size (int):  The sector size of the image.
+    *   writable (bool):    Map the image for writing.
+
+    .. note::
+
+        Writes go to the mapping and reach the file on flush or close, the
+        kernel is never asked to re-read the partition table. Image works
+        on the table regions only, to change partitions open the image
+        with Device and Disk, libparted handles image files directly.
+    """
+    def __init__(self, path, sector_size=512, writable=True):
+        self.path = path
+        self.sector_size = sector_size
+        self._file = open(path, 'r+b' if writable else 'rb')
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        self._map = mmap.mmap(self._file.fileno(), 0, access=access)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def length(self):
+        """
+        Returns the image length in sectors.
+        """
+        return len(self._map) // self.sector_size
+
+    def read(self, offset, size):
+        """
+        Returns size bytes at offset.
+        """
+        return self._map[offset:offset + size]
+
+    def write(self, offset, data):
+        """
+        Writes data at offset.
+        """
+        self._map[offset:offset + len(data)] = data
+
+    def scan(self):
+        """
+        Returns the partition table as a reparted.scan.ScanResult.
+        """
+        return scan_reader(self.read, self.sector_size, self.length)
+
+    def regions(self):
+        """
+        Returns a dict of the partition table regions as (offset, size)
+        2-tuples in bytes.
+        """
+        ss = self.sector_size
+        regions = {'mbr': (0, 512)}
+        header = self.read(ss, gpt_header.size)
+        if len(header) < gpt_header.size:
+            return regions
+        fields = gpt_header.unpack(header)
+        if fields[0] != gpt_signature:
+            return regions
+        backup_lba, entries_lba, num_entries, entry_size = (fields[6], fields[10],
+                                                            fields[11], fields[12])
+        entries_size = num_entries * entry_size
+        regions['gpt_header'] = (ss, ss)
+        regions['gpt_entries'] = (entries_lba * ss, entries_size)
+        if (backup_lba + 1) * ss <= len(self._map):
+            backup = self.read(backup_lba * ss, gpt_header.size)
+            regions['gpt_backup_header'] = (backup_lba * ss, ss)
+            if backup[:8] == gpt_signature:
+                backup_entries = gpt_header.unpack(backup)[10]
+            else:
+                backup_entries = backup_lba - (entries_size + ss - 1) // ss
+            regions['gpt_backup_entries'] = (backup_entries * ss, entries_size)
+        return regions
+
+    def read_regions(self):
+        """
+        Returns a dict of the partition table regions contents, keyed
+        by region name with (offset, data) values.
+        """
+        return dict((name, (offset, self.read(offset, size)))
+                    for name, (offset, size) in self.regions().items())
+
+    def write_regions(self, regions, new_guids=True):
+        """
+        Writes the regions returned by read_regions to the image. By
+        default the copied table then gets new GUIDs (see new_guids), so
+        images stamped from the same template can be attached together.
+
+        *Args:*
+
+        *       regions (dict):     The regions returned by read_regions.
+        *       new_guids (bool):   Give the table new GUIDs.
+        """
+        for name, (offset, data) in regions.items():
+            self.write(offset, data)
+        if new_guids:
+            self.new_guids()
+
+    def new_guids(self):
+        """
+        Gives a gpt label a new random disk GUID and new partition GUIDs,
+        and updates the checksums of the primary and backup tables. For an
+        msdos label the disk signature is renewed instead. Returns False if
+        the image has no partition table.
+        """
+        regions = self.regions()
+        if 'gpt_header' not in regions:
+            if self.read(510, 2) != b'\x55\xaa':
+                return False
+            self.write(mbr_disk_signature, os.urandom(4))
+            return True
+        fields = gpt_header.unpack(self.read(self.sector_size, gpt_header.size))
+        num_entries, entry_size = fields[11], fields[12]
+        offset, size = regions['gpt_entries']
+        entries = bytearray(self.read(offset, size))
+        empty = bytearray(16)
+        for i in range(num_entries):
+            at = i * entry_size
+            if entries[at:at + 16] != empty:
+                entries[at + 16:at + 32] = uuid.uuid4().bytes_le
+        entries = bytes(entries)
+        entries_crc = zlib.crc32(entries) & 0xffffffff
+        disk_guid = uuid.uuid4().bytes_le
+        for header, table in (('gpt_header', 'gpt_entries'),
+                              ('gpt_backup_header', 'gpt_backup_entries')):
+            if header not in regions:
+                continue
+            self.write(regions[table][0], entries)
+            at = regions[header][0]
+            data = self.read(at, gpt_header.size)
+            if data[:8] != gpt_signature:
+                continue
+            fields = list(gpt_header.unpack(data))
+            fields[3], fields[9], fields[13] = 0, disk_guid, entries_crc
+            data = gpt_header.pack(*fields)
+            # The checksum covers header_size bytes, more than the known fields.
+            data += self.read(at + gpt_header.size, fields[2] - gpt_header.size)
+            fields[3] = zlib.crc32(data) & 0xffffffff
+            self.write(at, gpt_header.pack(*fields))
+        return True
+
+    def flush(self):
+        """
+        Flushes the mapping to the image file.
+        """
+        self._map.flush()
+
+    def close(self):
+        """
+        Flushes and unmaps the image.
+        """
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+            self._map = None
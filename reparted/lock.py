@@ -0,0 +1,100 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+import threading
+
+class RWLock(object):
+    """
+    *RWLock class is a reader-writer lock.*
+
+    Any number of threads can hold the read lock at once, the write lock
+    is exclusive. Waiting writers go before new readers. Both locks are
+    reentrant and the thread holding the write lock can also take the
+    read lock, but a thread holding only the read lock can not take the
+    write lock (RuntimeError is raised instead of deadlocking)::
+
+        from reparted.lock import RWLock
+
+        lock = RWLock()
+        with lock.reading():
+            ...
+        with lock.writing():
+            ...
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = {}
+        self._writer = None
+        self._writes = 0
+        self._waiting = 0
+
+    def acquire_read(self):
+        me = threading.current_thread()
+        with self._cond:
+            if self._writer is not me and me not in self._readers:
+                while self._writer is not None or self._waiting:
+                    self._cond.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.current_thread()
+        with self._cond:
+            count = self._readers[me] - 1
+            if count:
+                self._readers[me] = count
+            else:
+                del self._readers[me]
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.current_thread()
+        with self._cond:
+            if self._writer is me:
+                self._writes += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Can not upgrade a read lock to a write lock.")
+            self._waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting -= 1
+            self._writer = me
+            self._writes = 1
+
+    def release_write(self):
+        with self._cond:
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -1,6 +1,8 @@
 from conversion import *
 from exception import *
 from size import Size
+from geometry import align_start, align_end
+from planner import DiskModel, valid_types
 import os
 
 partition_type = {
@@ -30,10 +32,10 @@ partition_flag = {
     "LEGACY_BOOT" : 15
 }
 
-valid_types = {
-    'gpt' : ['NORMAL'],
-    'msdos' : ['NORMAL', 'LOGICAL', 'EXTENDED']
-}
+def release_partition(owned):
+    if owned[0]:
+        partition_destroy(owned[0])
+        owned[0] = None
 
 class Partition(object):
     """
@@ -80,10 +82,16 @@ class Partition(object):
        The start and end arguments are optional and you should only use them when
        your want to specify such attributes, otherwise use optimal alignment.
        The part argument is optional and mostly for internal use.
+       The properties read the partition under the disk read lock, so they
+       are safe to read while another thread changes the disk. Still, the
+       instance is only valid until its partition is deleted or the disk
+       is reloaded, threads that outlive such changes should read
+       Disk.layout or Disk.to_dict snapshots instead.
     """
     def __init__(self, disk, size=None, type='NORMAL', fs='ext3', align='optimal',
                     name='', start=None, end=None, part=None):
         self._disk = disk
+        self._owned = [None]
         if part:
             self._align = None
             self._partition = part
@@ -98,12 +106,13 @@ class Partition(object):
             else:
                 filesystem = None
             if align == 'optimal' or align == 'minimal':
-                dev = disk._ped_device
-                a_start, a_end = self._get_alignment(dev, align, start, end, size, type)
+                a_start, a_end = self._get_alignment(align, start, end, size, type)
             else:
                 raise PartitionError(708)
             part_type = [key for key,val in partition_type.iteritems() if val == type][0]
             self._partition = partition_new(disk._ped_disk, part_type, filesystem, a_start, a_end)
+            self._owned = disk._own_partition(self._partition)
+            finalize(self, release_partition, self._owned)
             sectors = self._partition.contents.geom.length
             size.sectors = sectors
             self._size = size
@@ -116,7 +125,7 @@ class Partition(object):
         if p_type not in valid_types.get(self._disk.type_name):
             raise PartitionError(711)
         if p_type == 'LOGICAL' or p_type == 'EXTENDED':
-            ext = [p for p in self._disk.partitions() if p.type == 'EXTENDED']
+            ext = [e for e in self._disk.layout() if e.type == 2]
             if not ext and p_type == 'LOGICAL':
                 raise PartitionError(713)
             if ext and p_type == 'EXTENDED':
@@ -143,10 +152,9 @@ class Partition(object):
 
             (start, end, length)
         """
-        start =  self._partition.contents.geom.start
-        end =  self._partition.contents.geom.end
-        length =  self._partition.contents.geom.length
-        return (start, end, length)
+        with self._disk._lock.reading():
+            geom = self._partition.contents.geom
+            return (geom.start, geom.end, geom.length)
 
     @property
     def size(self):
@@ -161,24 +169,27 @@ class Partition(object):
         Returns the partition number. If the partition is of type 'FREESPACE'
         it will return -1.
         """
-        return self._partition.contents.num
+        with self._disk._lock.reading():
+            return self._partition.contents.num
 
     @property
     def type(self):
         """
         Returns the partition type.
         """
-        return partition_type[self._partition.contents.type]
+        with self._disk._lock.reading():
+            return partition_type[self._partition.contents.type]
 
     @property
     def fs_type(self):
         """
         Returns the partition filesystem type.
         """
-        try:
-            fs = self._partition.contents.fs_type.contents.name
-        except ValueError:
-            fs = None
+        with self._disk._lock.reading():
+            try:
+                fs = self._partition.contents.fs_type.contents.name
+            except ValueError:
+                fs = None
         return fs
 
     @property
@@ -189,7 +200,8 @@ class Partition(object):
         """
         if self.disk.type_features != 'PARTITION_NAME' or self.type == 'FREESPACE':
             return None
-        return partition_get_name(self._partition)
+        with self._disk._lock.reading():
+            return partition_get_name(self._partition)
 
     @property
     def alignment(self):
@@ -205,13 +217,11 @@ class Partition(object):
         if self._align:
             return self._align
         else:
-            optimal = device_get_optimum_alignment(self.disk._ped_device)
-            minimal = device_get_minimum_alignment(self.disk._ped_device)
             start, e, l = self.geom
-            if start % optimal.contents.grain_size == optimal.contents.offset:
-                return 'optimal'
-            if start % minimal.contents.grain_size == minimal.contents.offset:
-                return 'minimal'
+            for align in ('optimal', 'minimal'):
+                alignment = self.device.get_alignment(align)
+                if alignment and start % alignment[1] == alignment[0]:
+                    return align
         return None
 
     def set_name(self, name):
@@ -229,9 +239,11 @@ class Partition(object):
         """
         if self.disk.type_features != 'PARTITION_NAME' or self.type == 'FREESPACE':
             raise NotImplementedError("The disk does not support partition names.")
-        new_name = partition_set_name(self._partition, name)
-        if not new_name:
-            raise PartitionError(704)
+        with self.disk._lock.writing():
+            new_name = partition_set_name(self._partition, name)
+            if not new_name:
+                raise PartitionError(704)
+            self.disk._names_changed()
         return
 
     def _snap_sectors(self, start, end, size, type):
@@ -240,49 +252,30 @@ class Partition(object):
                 end = start + size.sectors - 1
             if (end - start) != (size.sectors - 1):
                 raise PartitionError(709)
-        elif type == 'LOGICAL':
-            try:
-                last = [p for p in self._disk.partitions() if p.type == 'LOGICAL'][-1]
-            except IndexError:
-                last = [p for p in self._disk.partitions() if p.type == 'EXTENDED'][-1]
-            ls, e, ln = last.geom
-            start = ls + 1
-            end = start + size.sectors - 1
         else:
-            size = Size()
-            last = None
-            for part in self.disk.free_partitions():
-                if part.size > size:
-                    last = part
-            try:
-                start, e, ln = part.geom
-            except AttributeError:
-                raise PartitionError(712)
-            end = start + size.sectors - 1
+            # Placed as apply_layout places it, see DiskModel.plan.
+            model = DiskModel.from_disk(self._disk, self._align)
+            result = model.plan([(size, type)])
+            if result.errors:
+                raise result.errors[0][1]
+            start, end, length = result.geoms[0]
         return (start, end)
 
-    def _get_alignment(self, dev, align, start, end, size, type):
-        const = getattr(parted, "ped_device_get_%s_aligned_constraint" % align)
-        constraint = const(dev)
+    def _get_alignment(self, align, start, end, size, type):
+        constraint = self.device._get_constraint(align)
         start_offset = constraint.contents.start_align.contents.offset
         start_grain = constraint.contents.start_align.contents.grain_size
         end_offset = constraint.contents.end_align.contents.offset
         end_grain = constraint.contents.end_align.contents.grain_size
         snap_start, snap_end = self._snap_sectors(start, end, size, type)
-        if snap_start % start_grain == start_offset:
-            start = snap_start
-        else:
-            start = ((snap_start / start_grain) + 1) * start_grain
-        end = start + size.sectors
-        if (end - end_offset) % end_grain != end_offset:
-            end = ((end / end_grain) * end_grain) + end_offset
+        start = align_start(snap_start, start_grain, start_offset)
+        end = align_end(start, snap_end - snap_start + 1, end_grain, end_offset)
         return (start, end)
 
     def _check_flag(self, flag):
-        if not flag in partition_flag.keys():
+        if flag not in partition_flag:
             raise PartitionError(710)
-        check = partition_is_flag_available(self._partition, partition_flag[flag])
-        if not check:
+        if flag not in self.disk._available_flags(self._partition):
             raise PartitionError(710)
 
     def set_flag(self, flag, state):
@@ -296,6 +289,7 @@ class Partition(object):
         """
         if self.type != 'FREESPACE':
             self._check_flag(flag)
-            partition_set_flag(self._partition, partition_flag[flag], int(state))
+            with self.disk._lock.writing():
+                partition_set_flag(self._partition, partition_flag[flag], int(state))
         else:
             raise NotImplementedError("Operatin not supported on free space.")
\ No newline at end of file
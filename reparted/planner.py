@@ -0,0 +1,407 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from exception import PartitionError, SizeError
+from size import Size
+from freespace import FreeSpaceIndex, align_up
+from geometry import align_end
+from collections import namedtuple
+from fractions import Fraction
+
+LayoutSpec = namedtuple('LayoutSpec', ['size', 'type', 'fs', 'name', 'flags'])
+
+PlanResult = namedtuple('PlanResult', ['geoms', 'free', 'errors'])
+
+valid_types = {
+    'gpt' : ['NORMAL'],
+    'msdos' : ['NORMAL', 'LOGICAL', 'EXTENDED']
+}
+
+# Size in bytes of the gpt partition entry array (128 entries of 128 bytes).
+gpt_entries_size = 128 * 128
+
+def layout_spec(spec):
+    """
+    Returns a LayoutSpec from a (size, type, fs, name, flags) tuple or
+    dict, filling in the Partition defaults for missing values.
+    """
+    if isinstance(spec, LayoutSpec):
+        return spec
+    if isinstance(spec, dict):
+        spec = [spec.get(f) for f in LayoutSpec._fields]
+    else:
+        spec = list(spec) + [None] * (len(LayoutSpec._fields) - len(spec))
+    size, type, fs, name, flags = spec
+    if type is None:
+        type = 'NORMAL'
+    if fs is None and type != 'EXTENDED':
+        fs = 'ext3'
+    if isinstance(flags, dict):
+        flags = tuple(flags.items())
+    else:
+        flags = tuple((f, True) for f in flags or ())
+    return LayoutSpec(size, type, fs, name or '', flags)
+
+class Weight(object):
+    """
+    *Weight class sizes a layout spec as a share of the free space left
+    by the other specs.*
+
+    Specs with weights 2 and 1 get two thirds and one third of the space::
+
+        from reparted.planner import Weight
+
+        specs = [(Size(512, "MB"), 'NORMAL', 'fat32', 'boot'),
+                 (Weight(2), 'NORMAL', 'ext4', 'root'),
+                 (Weight(1), 'NORMAL', 'ext4', 'home')]
+
+    *Args:*
+
+    *   weight:     A positive int or float.
+
+    *Raises:*
+
+    *   SizeError
+    """
+    __slots__ = ('weight',)
+
+    def __init__(self, weight=1):
+        if not isinstance(weight, (int, long, float)) or weight <= 0:
+            raise SizeError(401)
+        self.weight = Fraction(weight)
+
+    def __getstate__(self):
+        return (self.weight,)
+
+    def __setstate__(self, state):
+        self.weight, = state
+
+    def __repr__(self):
+        return "Weight(%s)" % self.weight
+
+# Takes the rest of the free space, the same as a None size.
+FILL = Weight(1)
+
+def shares(units, weights):
+    """
+    Splits units in proportion to weights, rounding with the largest
+    remainder method so the shares add up to units exactly.
+    """
+    total = sum(Fraction(w) for w in weights)
+    quotas = [units * Fraction(w) / total for w in weights]
+    result = [int(q) for q in quotas]
+    left = units - sum(result)
+    order = sorted(range(len(quotas)), key=lambda i: (result[i] - quotas[i], i))
+    for i in order[:left]:
+        result[i] += 1
+    return result
+
+def usable_range(length, sector_size, label):
+    """
+    Returns the (first, last) sectors partitions can use on a disk of
+    the given label, leaving out the partition table metadata.
+    """
+    if label == 'gpt':
+        entries = -(-gpt_entries_size // sector_size)
+        return (2 + entries, length - 2 - entries)
+    return (1, length - 1)
+
+def _gaps(first, last, used):
+    extents = []
+    for start, end in sorted(used):
+        if start > first:
+            extents.append([first, start - 1])
+        first = max(first, end + 1)
+    if first <= last:
+        extents.append([first, last])
+    return extents
+
+class DiskModel(object):
+    """
+    *DiskModel class models a disk to plan partition layouts in pure
+    Python, without libparted or a device.*
+
+    The geometries it plans are the ones Disk.apply_layout, and a
+    Partition created without a start (then added with Disk.add_partition),
+    would get on a disk with the same parameters, so many candidate layouts
+    can be evaluated cheaply, or for disks that are not available::
+
+        from reparted import *
+        from reparted.planner import DiskModel
+
+        # A 4 TB disk with 4K sectors and 1 MiB alignment.
+        model = DiskModel(976754646, sector_size=4096, grain=256)
+        result = model.plan([(Size(512, "MiB"), 'NORMAL', 'fat32', 'boot'),
+                             (90, 'NORMAL', 'ext4', 'root')])
+        if not result.errors:
+            print result.geoms
+
+    *Args:*
+
+    *   length (int):       The disk length in sectors.
+    *   sector_size (int):  The logical sector size.
+    *   grain (int):        The alignment grain size in sectors.
+    *   offset (int):       The alignment offset in sectors.
+    *   label (str):        The partition table type ('gpt' or 'msdos').
+    *   partitions (list):  The existing partitions as (type, start, end)
+                            3-tuples, where type is 'NORMAL', 'EXTENDED'
+                            or 'LOGICAL'.
+
+    .. note::
+
+        The gpt model reserves the standard 128 entry table at both ends
+        of the disk, the msdos model only the first sector.
+    """
+    def __init__(self, length, sector_size=512, grain=1, offset=0, label='gpt',
+                 partitions=()):
+        self.length = length
+        self.sector_size = sector_size
+        self.grain = grain
+        self.offset = offset
+        self.label = label
+        first, last = usable_range(length, sector_size, label)
+        outer = [(s, e) for t, s, e in partitions if t != 'LOGICAL']
+        extended = [(s, e) for t, s, e in partitions if t == 'EXTENDED']
+        self.free = _gaps(first, last, outer)
+        self.logical_free = []
+        self.extended = bool(extended)
+        if extended:
+            # Each logical partition is preceded by its EBR sector.
+            used = [(s - 1, e) for t, s, e in partitions if t == 'LOGICAL']
+            self.logical_free = _gaps(extended[0][0], extended[0][1], used)
+
+    @classmethod
+    def from_device(cls, device, label='gpt', align='optimal'):
+        """
+        Returns an empty DiskModel with the parameters of a Device.
+
+        *Args:*
+
+        *       device:         A Device class instance.
+        *       label (str):    The partition table type ('gpt' or 'msdos').
+        *       align (str):    The partition alignment, 'minimal' or 'optimal'.
+        """
+        offset, grain = device.get_alignment(align) or (0, 1)
+        return cls(device.length, device.sector_size, grain, offset, label)
+
+    @classmethod
+    def from_disk(cls, disk, align='optimal'):
+        """
+        Returns a DiskModel of a Disk and its current partitions, with
+        the free space exactly as libparted reports it.
+
+        *Args:*
+
+        *       disk:           A Disk class instance.
+        *       align (str):    The partition alignment, 'minimal' or 'optimal'.
+        """
+        device = disk.device
+        model = cls.from_device(device, disk.type_name, align)
+        layout = disk.layout()
+        model.free = [list(e.geom[:2]) for e in layout if e.type == 4]
+        model.logical_free = [list(e.geom[:2]) for e in layout if e.type == 5]
+        model.extended = bool([e for e in layout if e.type == 2])
+        return model
+
+    def usable_sectors(self):
+        """
+        Returns the number of sectors partitions can use on the whole disk,
+        from the first aligned sector after the partition table metadata
+        to the last sector before the backup table (if any).
+        """
+        first, last = usable_range(self.length, self.sector_size, self.label)
+        return max(0, last - align_up(first, self.grain, self.offset) + 1)
+
+    def spec_sectors(self, size):
+        """
+        Returns the length in sectors of a spec size, either a Size
+        instance or a percent of the usable sectors of the disk (see
+        usable_sectors), rounded down to whole alignment grains so that
+        percents adding up to 100 fit the disk. Weight and None sizes
+        depend on the other specs, for those it returns None.
+
+        *Raises:*
+
+        *       SizeError
+        """
+        if isinstance(size, Size):
+            return (size.sectors * size.sector_size) // self.sector_size
+        if size is None or isinstance(size, Weight):
+            return None
+        if not isinstance(size, (int, long, float)) or not (0 < size <= 100):
+            raise SizeError(401)
+        sectors = long(self.usable_sectors() * Fraction(size) // 100)
+        # Less than a grain is kept as is, rather than rounded to nothing.
+        return sectors - (sectors % self.grain) or sectors
+
+    def _roomiest(self, index, after):
+        """
+        Returns the start of the free extent of index with the most room
+        at or after sector after, the first one of equal extents.
+        """
+        best, room = after, 0
+        for start, end in index:
+            if end - max(start, after) + 1 > room:
+                best, room = max(start, after), end - max(start, after) + 1
+        return best
+
+    def _place(self, specs, sizes, skip, pins):
+        types = valid_types.get(self.label, ())
+        grain, offset = self.grain, self.offset
+        # Ends fall on the sector before an aligned start, as in libparted's
+        # aligned constraints and Partition.
+        end_offset = (offset - 1) % grain
+        extents = {'free': FreeSpaceIndex(self.free),
+                   'logical': FreeSpaceIndex(self.logical_free)}
+        # Specs are placed in order, each after the one before it.
+        cursors = {'free': 0, 'logical': 0}
+        extended = self.extended
+        geoms = []
+        where = []
+        errors = {}
+
+        def place(i, name, lead):
+            index = extents[name]
+            after = cursors[name]
+            if i in pins:
+                # Elastic specs go where they have the most room to grow,
+                # and stay there as they grow.
+                if pins[i] is None:
+                    pins[i] = self._roomiest(index, after)
+                after = max(after, pins[i])
+            sectors = sizes[i]
+            fit = index.first_fit(sectors, grain, offset, after, lead)
+            if fit is None:
+                raise PartitionError(712)
+            start = fit[0]
+            end = align_end(start, sectors, grain, end_offset)
+            extent = index.find(start)
+            # The alignment gap in front is given up, as libparted does.
+            index.allocate(extent[0], end)
+            cursors[name] = end + 1
+            # Allocations only take the front of an extent, its end names it.
+            return (start, end, end - start + 1), (name, extent[1])
+
+        for i, spec in enumerate(specs):
+            geoms.append(None)
+            where.append(None)
+            if i in skip:
+                continue
+            try:
+                if spec.type not in types:
+                    raise PartitionError(711)
+                if spec.type == 'LOGICAL':
+                    if not extended:
+                        raise PartitionError(713)
+                    # Leave a sector in front of each logical partition for its EBR.
+                    geoms[i], where[i] = place(i, 'logical', 1)
+                    continue
+                if spec.type == 'EXTENDED' and extended:
+                    raise PartitionError(714)
+                geoms[i], where[i] = place(i, 'free', 0)
+            except PartitionError as e:
+                errors[i] = e
+                continue
+            if spec.type == 'EXTENDED':
+                extended = True
+                extents['logical'].add(geoms[i][0], geoms[i][1])
+        return geoms, where, extents, errors
+
+    def _grow(self, specs, sizes, elastic, pool, skip, pins):
+        """
+        Places the specs and hands the free sectors left at the end of each
+        extent of pool to the elastic specs placed in it. Growing a spec
+        by whole grains shifts the ones after it by whole grains, so their
+        alignment and the gaps between them stay the same. The sectors
+        short of a grain at the end of the extent are left free, an
+        aligned end can not reach them.
+        """
+        geoms, where, extents, errors = self._place(specs, sizes, skip, pins)
+        last = {}
+        for i, w in enumerate(where):
+            if w is not None and w[0] == pool:
+                if w not in last or geoms[i][1] > geoms[last[w]][1]:
+                    last[w] = i
+        for w, j in last.items():
+            members = [i for i in elastic if where[i] == w]
+            if not members:
+                continue
+            tail = w[1] - geoms[j][1]
+            weights = [getattr(specs[i].size, 'weight', 1) for i in members]
+            for i, units in zip(members, shares(tail // self.grain, weights)):
+                sizes[i] += units * self.grain
+
+    def plan(self, specs):
+        """
+        Places the partition specs, in order, at the first aligned free
+        sector each fits in, and returns a PlanResult 3-tuple:
+
+            (geoms, free, errors)
+
+        Where geoms has the (start, end, length) 3-tuple of each spec, or
+        None if it could not be placed, free is the list of (start, end)
+        free extents left outside the extended partition and errors is a
+        list of (index, error) 2-tuples, error being the PartitionError
+        or SizeError Disk.apply_layout would raise for the spec at index.
+
+        Spec sizes can be mixed, a Size instance is an absolute size, an int
+        or float is a percent of the usable disk space (see spec_sectors),
+        and Weight instances (or None, the
+        same as FILL or Weight(1)) share the free space left in proportion
+        to their weights::
+
+            from reparted.planner import DiskModel, Weight, FILL
+
+            model.plan([(10,), (30,), (FILL,)])
+            model.plan([(Size(1, "GB"),), (Weight(2),), (Weight(1),)])
+
+        Partitions end on the sector before an aligned start, as they do
+        with Partition, so a size that is not a whole number of alignment
+        grains is rounded down. Weighted partitions get whole alignment
+        grains, split by largest remainder, and less than a grain is left
+        free at the end of the extent.
+
+        *Args:*
+
+        *       specs (list):   The partition specs, as taken by Disk.apply_layout.
+
+        .. note::
+
+            The model itself is not changed. Weighted partitions are placed
+            in the free extent with the most room after the partition before
+            them, and only share that extent, a logical partition shares
+            the extended partition.
+        """
+        specs = [layout_spec(spec) for spec in specs]
+        sizes = []
+        size_errors = {}
+        for i, spec in enumerate(specs):
+            try:
+                sizes.append(self.spec_sectors(spec.size))
+            except SizeError as e:
+                sizes.append(None)
+                size_errors[i] = e
+        elastic = [i for i, n in enumerate(sizes) if n is None and i not in size_errors]
+        pins = dict((i, None) for i in elastic)
+        if elastic:
+            for i in elastic:
+                sizes[i] = self.grain
+            # Outer partitions first, the extended partition may grow.
+            for pool in ('free', 'logical'):
+                self._grow(specs, sizes, elastic, pool, size_errors, pins)
+        geoms, where, extents, errors = self._place(specs, sizes, size_errors, pins)
+        errors.update(size_errors)
+        free = list(extents['free'])
+        return PlanResult(geoms, free, sorted(errors.items()))
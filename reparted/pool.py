@@ -0,0 +1,215 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from device import Device
+from disk import Disk
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import os
+
+sys_class_block = "/sys/class/block"
+
+def device_stamp(path):
+    """
+    Returns the (device node mtime, uevent mtime) of a device path, any
+    of them is None if unavailable.
+    """
+    stamp = []
+    uevent = os.path.join(sys_class_block, os.path.basename(path), "uevent")
+    for p in (path, uevent):
+        try:
+            stamp.append(os.stat(p).st_mtime)
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+class PoolEntry(object):
+    def __init__(self, device):
+        self.device = device
+        self.disk = None
+        self.disk_refs = 0
+        # Replaced Disks still held, with their reference counts.
+        self.retired = {}
+        self.changed = False
+        self.refs = 0
+        self.stamp = device_stamp(device.path)
+
+    def fresh_disk(self):
+        """
+        Makes the shared Disk current with the device. An unused Disk is
+        read again, one still held is retired and replaced by a new Disk,
+        so its holders keep their partitions and uncommitted changes.
+        """
+        if self.disk is None:
+            self.disk = Disk(self.device)
+        elif self.changed or self.disk.stale:
+            if self.disk_refs:
+                self.retired[self.disk] = self.disk_refs
+                self.disk = Disk(self.device)
+                self.disk_refs = 0
+            else:
+                self.disk.reload()
+        self.changed = False
+
+    def release_disk(self, disk):
+        if disk is self.disk:
+            self.disk_refs = max(0, self.disk_refs - 1)
+        elif disk in self.retired:
+            self.retired[disk] -= 1
+            if not self.retired[disk]:
+                del self.retired[disk]
+                disk.close()
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+        self.device.close()
+
+class DevicePool(object):
+    """
+    *DevicePool class shares Device and Disk instances per device.*
+
+    Paths are resolved to the canonical device path, so '/dev/disk/by-id'
+    symlinks share the same entry. Handles are reference counted, the
+    least recently used idle entries are closed when there are more than
+    max_idle of them::
+
+        from reparted.pool import device_pool
+
+        with device_pool.disk("/dev/disk/by-id/ata-VBOX_HARDDISK") as myDisk:
+            partitions = myDisk.partitions()
+
+    The shared Disk is read again when the device node or its uevent
+    changes, or when another Disk instance commits to the device. While
+    the shared Disk is held it is never read again, the next acquire_disk
+    gets a new Disk instead and the old one is closed when released.
+
+    *Args:*
+
+    *   max_idle (int):     The maximum number of idle entries kept open.
+
+    .. note::
+
+        The handles are shared, do not close them, release them instead.
+    """
+    def __init__(self, max_idle=16):
+        self.max_idle = max_idle
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, path):
+        path = os.path.realpath(path)
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            entry = PoolEntry(Device(path))
+        elif entry.stamp != device_stamp(path):
+            entry.stamp = device_stamp(path)
+            entry.device.refresh()
+            entry.changed = True
+        self._entries[path] = entry
+        return path, entry
+
+    def _evict(self):
+        idle = [p for p, e in self._entries.items() if not e.refs]
+        for path in idle[:max(0, len(idle) - self.max_idle)]:
+            self._entries.pop(path).close()
+
+    def acquire(self, path):
+        """
+        Returns the shared Device for path, release it when done.
+
+        *Raises:*
+
+        *       DeviceError
+        """
+        with self._lock:
+            path, entry = self._entry(path)
+            entry.refs += 1
+            return entry.device
+
+    def acquire_disk(self, path):
+        """
+        Returns the shared Disk for path, release it when done.
+
+        *Raises:*
+
+        *       DeviceError, DiskError
+        """
+        with self._lock:
+            path, entry = self._entry(path)
+            entry.fresh_disk()
+            entry.disk_refs += 1
+            entry.refs += 1
+            return entry.disk
+
+    def release(self, handle):
+        """
+        Releases a Device or Disk returned by acquire or acquire_disk.
+        """
+        device = handle._device if isinstance(handle, Disk) else handle
+        with self._lock:
+            for path, entry in self._entries.items():
+                if entry.device is device:
+                    entry.refs = max(0, entry.refs - 1)
+                    if isinstance(handle, Disk):
+                        entry.release_disk(handle)
+                    break
+            self._evict()
+
+    @contextmanager
+    def device(self, path):
+        """
+        Context manager version of acquire and release.
+        """
+        device = self.acquire(path)
+        try:
+            yield device
+        finally:
+            self.release(device)
+
+    @contextmanager
+    def disk(self, path):
+        """
+        Context manager version of acquire_disk and release.
+        """
+        disk = self.acquire_disk(path)
+        try:
+            yield disk
+        finally:
+            self.release(disk)
+
+    def invalidate(self, path):
+        """
+        Reads the shared Disk for path again on its next use.
+        """
+        with self._lock:
+            entry = self._entries.get(os.path.realpath(path))
+            if entry is not None:
+                entry.stamp = None
+
+    def clear(self):
+        """
+        Closes all idle entries.
+        """
+        with self._lock:
+            for path in [p for p, e in self._entries.items() if not e.refs]:
+                self._entries.pop(path).close()
+
+device_pool = DevicePool()
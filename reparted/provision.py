@@ -0,0 +1,101 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from device import Device
+from disk import Disk, layout_spec
+from collections import namedtuple
+from multiprocessing import Pool
+import time
+
+ProvisionResult = namedtuple('ProvisionResult', ['path', 'ok', 'elapsed',
+                                                 'partitions', 'error'])
+
+def provision_device(path, specs, label=None, align='optimal'):
+    """
+    This function applies a layout to a single device and returns a
+    ProvisionResult 5-tuple:
+
+        (path, ok, elapsed, partitions, error)
+
+    Where partitions is the list of the new partitions geometries and
+    error is the error message if ok is False.
+
+    *Args:*
+
+    *       path (str):     The device path.
+    *       specs (list):   The partition specs, as taken by Disk.apply_layout.
+    *       label (str):    If given, set this partition table first ('gpt' or 'msdos').
+    *       align (str):    The partition alignment, 'minimal' or 'optimal'.
+    """
+    started = time.time()
+    try:
+        with Device(path) as device:
+            with Disk(device) as disk:
+                if label:
+                    disk.set_label(label)
+                geoms = [p.geom for p in disk.apply_layout(specs, align)]
+        return ProvisionResult(path, True, time.time() - started, geoms, None)
+    except Exception as e:
+        error = "%s: %s" % (e.__class__.__name__, e)
+        return ProvisionResult(path, False, time.time() - started, [], error)
+
+def _provision_worker(args):
+    return provision_device(*args)
+
+def provision(paths, specs, label=None, align='optimal', processes=4, callback=None):
+    """
+    This function applies the same layout to several devices in parallel
+    worker processes, each with its own libparted state, and yields a
+    ProvisionResult for each device as it completes::
+
+        from reparted import *
+        from reparted.provision import provision
+
+        specs = [(Size(512, "MB"), 'NORMAL', 'fat32', 'boot', ['BOOT']),
+                 (90, 'NORMAL', 'ext4', 'root')]
+        for result in provision(["/dev/sdb", "/dev/sdc"], specs, label='gpt'):
+            if not result.ok:
+                print result.path, result.error
+
+    *Args:*
+
+    *       paths (list):           The device paths.
+    *       specs (list):           The partition specs, as taken by Disk.apply_layout.
+    *       label (str):            If given, set this partition table first.
+    *       align (str):            The partition alignment, 'minimal' or 'optimal'.
+    *       processes (int):        Maximum number of devices provisioned at once.
+    *       callback (callable):    Called with each ProvisionResult as it completes.
+
+    .. note::
+
+        Errors do not stop the other devices, check the ok field of each result.
+    """
+    paths = list(paths)
+    if not paths:
+        return
+    specs = [layout_spec(spec) for spec in specs]
+    tasks = [(path, specs, label, align) for path in paths]
+    pool = Pool(processes=max(1, min(processes, len(paths))))
+    try:
+        for result in pool.imap_unordered(_provision_worker, tasks):
+            if callback:
+                callback(result)
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,188 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import namedtuple
+import struct
+import stat
+import uuid
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BLKSSZGET = 0x1268
+BLKGETSIZE64 = 0x80081272
+
+mbr_signature = b'\x55\xaa'
+gpt_signature = b'EFI PART'
+gpt_protective = 0xee
+extended_types = (0x05, 0x0f, 0x85)
+
+mbr_entry = struct.Struct('<B3sB3sII')
+gpt_header = struct.Struct('<8sIIIIQQQQ16sQIII')
+gpt_entry = struct.Struct('<16s16sQQQ72s')
+
+# Default GPT entry array: 128 entries of 128 bytes.
+gpt_entries_size = 128 * 128
+
+# Upper bound on the EBR chain, guards against loops in corrupt tables.
+max_logical = 256
+
+ScanResult = namedtuple('ScanResult', ['label', 'sector_size', 'length', 'partitions'])
+
+ScanEntry = namedtuple('ScanEntry', ['num', 'type', 'geom', 'name', 'guid'])
+
+class FileReader(object):
+    """
+    Reads byte ranges from an open file object.
+    """
+    def __init__(self, f):
+        self._file = f
+
+    def __call__(self, offset, size):
+        self._file.seek(offset)
+        return self._file.read(size)
+
+def _geom(start, length):
+    return (start, start + length - 1, length)
+
+def _mbr_entries(data):
+    entries = []
+    if data[510:512] != mbr_signature:
+        return None
+    for i in range(4):
+        status, chs1, p_type, chs2, start, length = mbr_entry.unpack_from(data, 446 + i * 16)
+        entries.append((p_type, start, length))
+    return entries
+
+def _scan_gpt(read, data, sector_size):
+    header = data[sector_size:sector_size + gpt_header.size]
+    if len(header) < gpt_header.size:
+        return None
+    (signature, revision, header_size, crc, reserved, current_lba, backup_lba,
+     first_usable, last_usable, disk_guid, entries_lba, num_entries, entry_size,
+     entries_crc) = gpt_header.unpack(header)
+    if signature != gpt_signature or entry_size < gpt_entry.size:
+        return None
+    offset = entries_lba * sector_size
+    size = num_entries * entry_size
+    if offset + size <= len(data):
+        entries = data[offset:offset + size]
+    else:
+        entries = read(offset, size)
+    empty = b'\x00' * 16
+    partitions = []
+    for i in range(min(num_entries, len(entries) // entry_size)):
+        type_guid, part_guid, first, last, attrs, name = gpt_entry.unpack_from(entries, i * entry_size)
+        if type_guid == empty:
+            continue
+        name = name.decode('utf-16-le').split(u'\x00')[0]
+        guid = str(uuid.UUID(bytes_le=part_guid))
+        partitions.append(ScanEntry(i + 1, 'NORMAL', _geom(first, last - first + 1), name, guid))
+    return partitions
+
+def _scan_msdos(read, entries, sector_size):
+    partitions = []
+    extended = None
+    for i, (p_type, start, length) in enumerate(entries):
+        if not p_type:
+            continue
+        if p_type in extended_types:
+            extended = start
+            partitions.append(ScanEntry(i + 1, 'EXTENDED', _geom(start, length), None, None))
+        else:
+            partitions.append(ScanEntry(i + 1, 'NORMAL', _geom(start, length), None, None))
+    ebr = extended
+    num = 5
+    seen = set()
+    while ebr is not None and ebr not in seen and len(seen) < max_logical:
+        seen.add(ebr)
+        links = _mbr_entries(read(ebr * sector_size, 512))
+        if not links:
+            break
+        p_type, start, length = links[0]
+        if p_type and length:
+            partitions.append(ScanEntry(num, 'LOGICAL', _geom(ebr + start, length), None, None))
+            num += 1
+        p_type, start, length = links[1]
+        ebr = extended + start if p_type in extended_types and start else None
+    return partitions
+
+def scan_reader(read, sector_size=512, length=None):
+    """
+    This function reads the partition table using the read callable,
+    which takes an (offset, size) in bytes and returns the data. It is
+    used by scan, see scan for the result.
+    """
+    head_size = sector_size * 2 + gpt_entries_size
+    data = read(0, head_size)
+    entries = _mbr_entries(data)
+    if entries is None:
+        return ScanResult(None, sector_size, length, [])
+    if [e for e in entries if e[0] == gpt_protective]:
+        partitions = _scan_gpt(read, data, sector_size)
+        if partitions is not None:
+            return ScanResult('gpt', sector_size, length, partitions)
+    return ScanResult('msdos', sector_size, length, _scan_msdos(read, entries, sector_size))
+
+def scan(path, sector_size=None):
+    """
+    This function reads the partition table of a device or image file
+    directly, without libparted, and returns a ScanResult 4-tuple:
+
+        (label, sector_size, length, partitions)
+
+    Where label is 'gpt', 'msdos' or None, length is the device length in
+    sectors and partitions is a list of ScanEntry 5-tuples:
+
+        (num, type, geom, name, guid)
+
+    The geom is the same (start, end, length) 3-tuple as Partition.geom,
+    name and guid are only available on gpt disks::
+
+        from reparted.scan import scan
+
+        result = scan("/dev/sdb")
+        for part in result.partitions:
+            print part.num, part.geom, part.name
+
+    The table is read with one large read (two for gpt disks with a non
+    standard entry array), plus one per logical partition on msdos disks.
+
+    *Args:*
+
+    *       path (str):         Path to the device or image file.
+    *       sector_size (int):  The logical sector size, by default it is read
+                                from the block device, or 512 for files.
+
+    .. note::
+
+        This is read only and does not validate checksums, use Disk for
+        anything other than inventory.
+    """
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if stat.S_ISBLK(st.st_mode) and fcntl is not None:
+            buf = struct.pack('Q', 0)
+            size = struct.unpack('Q', fcntl.ioctl(f.fileno(), BLKGETSIZE64, buf))[0]
+            if sector_size is None:
+                buf = struct.pack('i', 0)
+                sector_size = struct.unpack('i', fcntl.ioctl(f.fileno(), BLKSSZGET, buf))[0]
+        else:
+            size = st.st_size
+        sector_size = sector_size or 512
+        return scan_reader(FileReader(f), sector_size, size // sector_size)
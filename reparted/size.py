@@ -14,6 +14,7 @@
 #along with reparted.  If not, see <http://www.gnu.org/licenses/>.
 
 from exception import SizeError
+from fractions import Fraction
 
 size_units = {
     "B":    1,       # byte
@@ -36,16 +37,17 @@ size_units = {
 }
 
 def sectors_from_units(length, units, sector_size):
+    if isinstance(length, (int, long)):
+        return (size_units[units] * length) // sector_size
     sectors = long((size_units[units] * length) / sector_size)
     return sectors
 
 def sectors_from_percent(length, device):
     if not device:
         raise SizeError(400)
-    if not (0 < length <= 100) or type(length) is float:
+    if not isinstance(length, (int, long, float)) or not (0 < length <= 100):
         raise SizeError(401)
-    sectors = long((device.length / 100) * length)
-    return sectors
+    return long(device.length * Fraction(length) // 100)
 
 def size_from_units(sectors, units, sector_size):
     size = ((float(sectors) * sector_size) / size_units[units])
@@ -75,12 +77,17 @@ class Size(object):
 
     There is an option to choose percentage *'%'* as units, in which case
     you need to pass a Device instance to calculate the sectors needed
-    and length should be between 1 and 100::
+    and length should be greater than 0 and up to 100. The sectors are a
+    percent of the whole device and rounded down, so percents adding up to
+    100 can still be more than the partitions can get once the partition
+    table and alignment are left out. Disk.apply_layout takes percents of
+    the usable space instead::
 
         from reparted import *
 
         myDevice = Device('/dev/sda')
         mySize = Size(25, "%", dev=myDevice)
+        otherSize = Size(12.5, "%", dev=myDevice)
 
     Since version 1.2, the Size class supports basic operations::
 
@@ -93,7 +100,11 @@ class Size(object):
         if newSize > Size(3, "GB"):
             print "YAY!"
 
-    Supported operations are *+ - += -= < <= >= > == !=*.
+    Supported operations are *+ - += -= < <= >= > == !=*. Operations are
+    done in whole sectors, so they are exact regardless of the size, and
+    Size instances can be summed and used as dictionary keys::
+
+        total = sum([Size(4, "GB"), Size(512, "MB")])
 
     *Args:*
 
@@ -114,6 +125,8 @@ class Size(object):
        disks make sure they all have the same sector size.
 
     """
+    __slots__ = ('sector_size', 'sectors')
+
     def __init__(self, length=0, units="MB", sector_size=512, dev=None):
         self.sector_size = getattr(dev, "sector_size", sector_size)
         if units != "%":
@@ -121,13 +134,54 @@ class Size(object):
         else:
             self.sectors = sectors_from_percent(length, dev)
 
+    @classmethod
+    def from_sectors(cls, sectors, sector_size=512):
+        """
+        Returns a new Size instance of the given sectors, skipping
+        any units conversion.
+
+        *Args:*
+
+        *       sectors (int):      The length in sectors.
+        *       sector_size (int):  The sector size.
+        """
+        size = cls.__new__(cls)
+        size.sector_size = sector_size
+        size.sectors = sectors
+        return size
+
+    def __getstate__(self):
+        return (self.sector_size, self.sectors)
+
+    def __setstate__(self, state):
+        self.sector_size, self.sectors = state
+
+    def _bytes(self):
+        return self.sectors * self.sector_size
+
+    def _add(self, other, sign):
+        if self.sector_size == other.sector_size:
+            sectors = self.sectors + sign * other.sectors
+        else:
+            sectors = (self._bytes() + sign * other._bytes()) // self.sector_size
+        return Size.from_sectors(sectors, self.sector_size)
+
+    def _cmp(self, other):
+        if self.sector_size == other.sector_size:
+            a, b = self.sectors, other.sectors
+        else:
+            a, b = self._bytes(), other._bytes()
+        return (a > b) - (a < b)
+
     def __add__(self, other):
-        size = self.to("B") + other.to("B")
-        return Size(length=size, units="B", sector_size=self.sector_size)
+        if not isinstance(other, Size):
+            return NotImplemented
+        return self._add(other, 1)
 
     def __sub__(self, other):
-        size = self.to("B") - other.to("B")
-        return Size(length=size, units="B", sector_size=self.sector_size)
+        if not isinstance(other, Size):
+            return NotImplemented
+        return self._add(other, -1)
 
     def __iadd__(self, other):
         return self.__add__(other)
@@ -136,36 +190,43 @@ class Size(object):
         return self.__sub__(other)
 
     def __radd__(self, other):
-        size = other.to("B") + self.to("B")
-        return Size(length=size, units="B", sector_size=self.sector_size)
-
-    def __rsub__(self, other):
-        size = other.to("B") - self.to("B")
-        return Size(length=size, units="B", sector_size=self.sector_size)
+        # Allows sum() over Size instances, which starts from 0.
+        if other == 0:
+            return Size.from_sectors(self.sectors, self.sector_size)
+        return NotImplemented
 
     def __lt__(self, other):
-        t = self.to("B") < other.to("B")
-        return t
+        if not isinstance(other, Size):
+            return NotImplemented
+        return self._cmp(other) < 0
 
     def __gt__(self, other):
-        t = self.to("B") > other.to("B")
-        return t
+        if not isinstance(other, Size):
+            return NotImplemented
+        return self._cmp(other) > 0
 
     def __eq__(self, other):
-        t = self.to("B") == other.to("B")
-        return t
+        if not isinstance(other, Size):
+            return NotImplemented
+        return self._cmp(other) == 0
 
     def __ne__(self, other):
-        t = self.to("B") != other.to("B")
-        return t
+        if not isinstance(other, Size):
+            return NotImplemented
+        return self._cmp(other) != 0
 
     def __le__(self, other):
-        t = self.to("B") <= other.to("B")
-        return t
+        if not isinstance(other, Size):
+            return NotImplemented
+        return self._cmp(other) <= 0
 
     def __ge__(self, other):
-        t = self.to("B") >= other.to("B")
-        return t
+        if not isinstance(other, Size):
+            return NotImplemented
+        return self._cmp(other) >= 0
+
+    def __hash__(self):
+        return hash(self._bytes())
 
     def __str__(self):
         return self.pretty()
@@ -0,0 +1,62 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures Disk.commit latency per commit mode on a gpt image file. Images
+have no kernel partition table, so 'full' only writes the table there;
+run it against a scratch block device to time the kernel re-read too.
+Needs libparted. Run it by hand from the repository root::
+
+    python tests/bench_commit.py [commits] [device]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.helpers import libparted_available, write_gpt
+from reparted import Device, Disk
+
+def main(commits=200, path=None):
+    if not libparted_available():
+        print("libparted is not available")
+        return
+    tmpdir = None
+    if path is None:
+        tmpdir = tempfile.mkdtemp(prefix="reparted-bench-")
+        path = os.path.join(tmpdir, "disk.img")
+        with open(path, 'wb') as f:
+            f.truncate(131072 * 512)
+        write_gpt(path, [(2048, 10239, u'boot'), (10240, 131038, u'root')])
+    try:
+        with Device(path) as device:
+            with Disk(device) as disk:
+                for mode in ('device', 'full'):
+                    started = time.time()
+                    for i in range(commits):
+                        disk.commit(mode)
+                    elapsed = time.time() - started
+                    print("commit(%r): %.3f ms" % (mode, elapsed * 1000 / commits))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200, *args[1:])
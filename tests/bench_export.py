@@ -0,0 +1,59 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures export_layouts over many disks. The disks are stubs with a fixed
+layout snapshot and a hand filled ped_device, so this times the dict and
+JSON lines building only, not the libparted partition walk (that is done
+once per disk and cached, see Disk.layout). Run it by hand from the
+repository root::
+
+    python tests/bench_export.py [disks] [partitions]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.bench_properties import fake_device
+from tests.test_disk import StubDisk, entry
+from reparted.disk import export_layouts
+
+class Sink(object):
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+def main(disks=1000, partitions=8):
+    layout = [entry(i + 1, 0, 2048 * (i + 1), 2048 * (i + 2) - 1)
+              for i in range(partitions)]
+    stubs = []
+    for i in range(disks):
+        disk = StubDisk(layout)
+        disk._device = fake_device()
+        stubs.append(disk)
+    sink = Sink()
+    started = time.time()
+    export_layouts(stubs, sink)
+    elapsed = time.time() - started
+    print("export_layouts of %d disks with %d partitions: %.1f ms (%.3f ms per disk, %d bytes)"
+          % (disks, partitions, elapsed * 1000, elapsed * 1000 / disks, sink.size))
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,46 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the cost of importing reparted in a fresh interpreter, and
+checks that libparted is not loaded by the import. Run it by hand from
+the repository root::
+
+    python tests/bench_import.py [runs]
+"""
+
+import subprocess
+import sys
+import time
+
+code = ("import time; t = time.time(); import reparted; t = time.time() - t; "
+        "from reparted.conversion import parted; "
+        "print('%f %d' % (t, parted._cdll is not None))")
+
+def main(runs=20):
+    times = []
+    loaded = False
+    for i in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", code])
+        t, lib = out.split()
+        times.append(float(t))
+        loaded = loaded or bool(int(lib))
+    times.sort()
+    print("import reparted: median %.2f ms, min %.2f ms over %d runs"
+          % (times[len(times) // 2] * 1000, times[0] * 1000, runs))
+    print("libparted loaded by the import: %s" % loaded)
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,90 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures Device property reads from the DeviceInfo record against
+properties reading the ped_device struct on every access, as Device did
+before. A ped_device
+struct is filled in by hand, so libparted is not needed. Run it by hand
+from the repository root::
+
+    python tests/bench_properties.py [reads]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reparted.conversion import PedDevice
+from reparted.device import Device
+from ctypes import pointer
+
+class StructDevice(object):
+    """
+    Device properties as they were, reading the struct on every access.
+    """
+    def __init__(self, dev):
+        self._device = dev
+
+    @property
+    def _ped_device(self):
+        return self._device
+
+    @property
+    def path(self):
+        return self._ped_device.contents.path
+
+    @property
+    def length(self):
+        return self._ped_device.contents.length
+
+    @property
+    def sector_size(self):
+        return self._ped_device.contents.sector_size
+
+    @property
+    def model(self):
+        return self._ped_device.contents.model
+
+def fake_device():
+    ped = PedDevice()
+    ped.model = b"Bench Disk"
+    ped.path = b"/dev/bench"
+    ped.type = 1
+    ped.sector_size = ped.phys_sector_size = 512
+    ped.length = 2097152
+    device = Device.__new__(Device)
+    device._device = pointer(ped)
+    device.refresh()
+    return device
+
+def main(reads=100000):
+    device = fake_device()
+    old = StructDevice(device._ped_device)
+
+    def read(d):
+        for i in range(reads):
+            d.path, d.length, d.sector_size, d.model
+
+    runs = 5
+    a = min(timeit.repeat(lambda: read(device), number=1, repeat=runs))
+    b = min(timeit.repeat(lambda: read(old), number=1, repeat=runs))
+    print("%d reads of 4 properties from DeviceInfo: %.1f ms" % (reads, a * 1000))
+    print("%d reads of 4 properties from the ped_device struct: %.1f ms" % (reads, b * 1000))
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
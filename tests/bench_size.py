@@ -0,0 +1,46 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures creating and summing Size instances, and their memory size.
+Run it by hand from the repository root::
+
+    python tests/bench_size.py [count]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reparted import Size
+
+def main(count=100000):
+    sizes = [Size(i % 512 + 1, "MB") for i in range(count)]
+    mixed = [Size(i % 512 + 1, "MB", sector_size=4096 if i % 2 else 512)
+             for i in range(count)]
+    runs = 5
+    create = min(timeit.repeat(lambda: [Size(4, "GB") for i in range(count)],
+                               number=1, repeat=runs))
+    same = min(timeit.repeat(lambda: sum(sizes), number=1, repeat=runs))
+    both = min(timeit.repeat(lambda: sum(mixed), number=1, repeat=runs))
+    print("create %d Size: %.1f ms" % (count, create * 1000))
+    print("sum %d Size, one sector size: %.1f ms" % (count, same * 1000))
+    print("sum %d Size, mixed sector sizes: %.1f ms" % (count, both * 1000))
+    print("Size instance: %d bytes" % sys.getsizeof(sizes[0]))
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
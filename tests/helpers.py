@@ -0,0 +1,120 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from reparted.conversion import parted
+import tempfile
+import shutil
+import struct
+import uuid
+import zlib
+import os
+
+def libparted_available():
+    try:
+        parted._load()
+    except Exception:
+        return False
+    return True
+
+class ImageTestMixin(object):
+    """
+    Gives each test a temporary directory and makes image files in it.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="reparted-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def image_path(self, name="disk.img", sectors=131072, sector_size=512):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            f.truncate(sectors * sector_size)
+        return path
+
+# Linux filesystem data partition type.
+linux_type_guid = uuid.UUID("0fc63daf-8483-4772-8e79-3d69d8477de4")
+
+gpt_header = struct.Struct('<8sIIIIQQQQ16sQIII')
+gpt_entry = struct.Struct('<16s16sQQQ72s')
+mbr_entry = struct.Struct('<B3sB3sII')
+
+def _crc(data):
+    return zlib.crc32(data) & 0xffffffff
+
+def mbr(entries):
+    data = bytearray(512)
+    for i, (p_type, start, length) in enumerate(entries):
+        mbr_entry.pack_into(data, 446 + i * 16, 0, b'\0' * 3, p_type, b'\0' * 3, start, length)
+    data[510:512] = b'\x55\xaa'
+    return bytes(data)
+
+def write_sector(path, sector, data, sector_size=512):
+    with open(path, 'r+b') as f:
+        f.seek(sector * sector_size)
+        f.write(data)
+
+def write_gpt(path, partitions, sector_size=512):
+    """
+    Writes a gpt label with the (start, end, name) partitions on the image
+    at path, including the protective MBR and backup table, and returns
+    the partition GUIDs.
+    """
+    ss = sector_size
+    sectors = os.path.getsize(path) // ss
+    entries_sectors = (128 * 128) // ss
+    guids = []
+    entries = bytearray(128 * 128)
+    for i, (start, end, name) in enumerate(partitions):
+        guid = uuid.uuid4()
+        guids.append(str(guid))
+        gpt_entry.pack_into(entries, i * 128, linux_type_guid.bytes_le, guid.bytes_le,
+                            start, end, 0, name.encode('utf-16-le'))
+    entries = bytes(entries)
+    disk_guid = uuid.uuid4().bytes_le
+    last = sectors - 1
+
+    def header(current, backup, entries_lba):
+        fields = [b'EFI PART', 0x10000, 92, 0, 0, current, backup,
+                  2 + entries_sectors, last - 1 - entries_sectors, disk_guid,
+                  entries_lba, 128, 128, _crc(entries)]
+        fields[3] = _crc(gpt_header.pack(*fields))
+        return gpt_header.pack(*fields).ljust(ss, b'\0')
+
+    write_sector(path, 0, mbr([(0xee, 1, min(last, 0xffffffff))]))
+    write_sector(path, 1, header(1, last, 2) + entries, ss)
+    write_sector(path, last - entries_sectors, entries + header(last, 1, last - entries_sectors), ss)
+    return guids
+
+def write_msdos(path, primaries, logicals=(), extended=None):
+    """
+    Writes an msdos label on the image at path with the (start, end)
+    primaries, and an extended partition (start, end) holding the (start,
+    end) logicals linked by an EBR chain. The first EBR is the first sector
+    of the extended partition, the others are in the sector before their
+    logical partition.
+    """
+    entries = [(0x83, s, e - s + 1) for s, e in primaries]
+    if extended is not None:
+        entries.append((0x05, extended[0], extended[1] - extended[0] + 1))
+    write_sector(path, 0, mbr(entries))
+    if not logicals:
+        return
+    ebrs = [extended[0]] + [start - 1 for start, end in logicals[1:]]
+    for i, (start, end) in enumerate(logicals):
+        links = [(0x83, start - ebrs[i], end - start + 1)]
+        if i + 1 < len(logicals):
+            links.append((0x05, ebrs[i + 1] - extended[0], logicals[i + 1][1] - ebrs[i + 1] + 1))
+        write_sector(path, ebrs[i], mbr(links))
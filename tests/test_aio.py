@@ -0,0 +1,91 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from tests.helpers import ImageTestMixin, libparted_available
+from reparted import Size
+import threading
+import unittest
+
+try:
+    from reparted import aio
+except ImportError:
+    aio = None
+
+@unittest.skipIf(aio is None, "asyncio (or trollius) is not installed")
+class AioTestCase(ImageTestMixin, unittest.TestCase):
+    def setUp(self):
+        super(AioTestCase, self).setUp()
+        self.loop = aio.asyncio.new_event_loop()
+        aio.asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        super(AioTestCase, self).tearDown()
+
+class AioRunTest(AioTestCase):
+    def test_calls_run_in_order(self):
+        order = []
+        futures = [aio.run("/dev/null", order.append, i) for i in range(20)]
+        self.loop.run_until_complete(aio.asyncio.gather(*futures))
+        self.assertEqual(order, list(range(20)))
+
+    def test_cancel_keeps_calls_serialized(self):
+        release = threading.Event()
+        order = []
+
+        def slow():
+            release.wait(5)
+            order.append('slow')
+
+        first = aio.run("/dev/null", slow)
+        second = aio.run("/dev/null", order.append, 'next')
+        self.loop.run_until_complete(aio.asyncio.sleep(0.01))
+        first.cancel()
+        self.loop.run_until_complete(aio.asyncio.sleep(0.05))
+        self.assertEqual(order, [])
+        release.set()
+        self.loop.run_until_complete(second)
+        self.assertEqual(order, ['slow', 'next'])
+
+    def test_cancelled_before_start_is_skipped(self):
+        release = threading.Event()
+        order = []
+        first = aio.run("/dev/null", release.wait, 5)
+        second = aio.run("/dev/null", order.append, 'skipped')
+        third = aio.run("/dev/null", order.append, 'third')
+        second.cancel()
+        release.set()
+        self.loop.run_until_complete(third)
+        self.assertEqual(order, ['third'])
+
+    def test_exception_is_propagated(self):
+        future = aio.run("/dev/null", int, "x")
+        self.assertRaises(ValueError, self.loop.run_until_complete, future)
+
+@unittest.skipUnless(libparted_available(), "libparted is not available")
+class AioImageTest(AioTestCase):
+    def test_layout_on_image(self):
+        path = self.image_path()
+        run = self.loop.run_until_complete
+        disk = run(aio.open_disk(path))
+        run(disk.set_label('gpt'))
+        run(disk.apply_layout([(Size(8, "MB"),), (50,)], 'optimal', 'device'))
+        layouts = run(aio.gather_disks([path]))
+        geoms = [geom for num, type, geom in layouts[0] if type == 0]
+        self.assertEqual(len(geoms), 2)
+        self.assertTrue(geoms[0][1] < geoms[1][0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from reparted import conversion
+from reparted.conversion import LazyFunction
+import unittest
+
+class FakeFunction(LazyFunction):
+    """
+    A LazyFunction over a Python callable instead of a libparted symbol.
+    """
+    def __init__(self, name, fn):
+        LazyFunction.__init__(self, name)
+        self._fake = fn
+
+    def _resolve(self):
+        self._raw = self._fake
+        self._instrument(conversion.instrumentation.enabled)
+        return self._fn
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.new = FakeFunction('ped_constraint_new', lambda *args: 1)
+        self.destroy = FakeFunction('ped_constraint_destroy', lambda *args: None)
+        conversion.reset_instrumentation()
+
+    def tearDown(self):
+        conversion.disable_instrumentation()
+        conversion.reset_instrumentation()
+        for fn in (self.new, self.destroy):
+            conversion.functions.remove(fn)
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self.new(), 1)
+        self.assertEqual(conversion.instrumentation_stats()['calls'], {})
+
+    def test_counts(self):
+        conversion.enable_instrumentation()
+        self.new()
+        self.new()
+        self.destroy()
+        stats = conversion.instrumentation_stats()
+        self.assertEqual(stats['calls']['ped_constraint_new']['count'], 2)
+        self.assertTrue(stats['calls']['ped_constraint_new']['max'] >= 0)
+        self.assertEqual(stats['allocations'], {'constraint': {'created': 2, 'destroyed': 1}})
+
+    def test_resolved_before_enabling(self):
+        self.new()
+        conversion.enable_instrumentation()
+        self.new()
+        conversion.disable_instrumentation()
+        self.new()
+        stats = conversion.instrumentation_stats()
+        self.assertEqual(stats['calls']['ped_constraint_new']['count'], 1)
+
+    def test_callback(self):
+        seen = []
+        conversion.enable_instrumentation(lambda name, elapsed: seen.append(name))
+        self.destroy()
+        self.assertEqual(seen, ['ped_constraint_destroy'])
+
+    def test_reset(self):
+        conversion.enable_instrumentation()
+        self.new()
+        conversion.reset_instrumentation()
+        self.assertEqual(conversion.instrumentation_stats(),
+                         {'calls': {}, 'allocations': {}})
+
+if __name__ == '__main__':
+    unittest.main()
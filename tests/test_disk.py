@@ -0,0 +1,310 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from tests.helpers import ImageTestMixin, libparted_available, write_gpt, write_msdos
+from reparted.disk import Disk, LayoutEntry, commit_deferred
+from reparted.exception import DiskError, DiskCommitError
+from reparted import disk as disk_module
+from reparted.lock import RWLock
+from reparted import Size
+import threading
+import unittest
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+class StubDevice(object):
+    path = "/dev/stub"
+    type = 'SCSI'
+    length = 131072
+    sector_size = 512
+
+    def get_alignment(self, align='optimal'):
+        return (0, 2048)
+
+class StubDisk(Disk):
+    """
+    A Disk over a fixed layout snapshot, without libparted.
+    """
+    _ped_disk = True
+    type_name = 'msdos'
+
+    def __init__(self, entries):
+        self._lock = RWLock()
+        self._device = StubDevice()
+        self._features = 'EXTENDED'
+        self._entries = tuple(entries)
+        self._transaction = False
+        self._guids = None
+        self._commit_generation = 0
+
+    def layout(self):
+        return self._entries
+
+def entry(num, type, start, end):
+    return LayoutEntry(num, type, (start, end, end - start + 1), 'ext4', None, None)
+
+# NORMAL 1, EXTENDED 2 holding LOGICAL 5 and 6.
+msdos_layout = [entry(1, 0, 2048, 20479), entry(2, 2, 20480, 131071),
+                entry(5, 1, 22528, 40959), entry(6, 1, 43008, 60000)]
+
+class DiffTest(unittest.TestCase):
+    def test_extended_replaced(self):
+        disk = StubDisk(msdos_layout)
+        specs = [(Size(18432 * 512, "B"),), (Size(1, "MiB"),), (Size(1, "MiB"),)]
+        ops = disk.diff(specs)
+        self.assertEqual([(op.action, op.num) for op in ops],
+                         [('delete', 2), ('add', None), ('add', None)])
+
+    def test_extended_removed(self):
+        disk = StubDisk(msdos_layout)
+        ops = disk.diff([(Size(18432 * 512, "B"),)])
+        self.assertEqual([(op.action, op.num) for op in ops], [('delete', 2)])
+
+    def test_logicals_deleted_first(self):
+        disk = StubDisk(msdos_layout)
+        ops = disk.diff([(Size(18432 * 512, "B"),), (Size(110592 * 512, "B"), 'EXTENDED')])
+        self.assertEqual([(op.action, op.num) for op in ops], [('delete', 6), ('delete', 5)])
+
+class CommitModeTest(unittest.TestCase):
+    """
+    Records the libparted commit calls each mode makes.
+    """
+    def setUp(self):
+        self.calls = []
+        self.saved = (disk_module.disk_commit_to_dev, disk_module.disk_commit_to_os)
+        disk_module.disk_commit_to_dev = lambda d: self.calls.append('dev') or 1
+        disk_module.disk_commit_to_os = lambda d: self.calls.append('os') or 1
+
+    def tearDown(self):
+        disk_module.disk_commit_to_dev, disk_module.disk_commit_to_os = self.saved
+        disk_module.deferred_disks.clear()
+        for path in list(disk_module.commit_generation):
+            if path.startswith("/dev/stub"):
+                del disk_module.commit_generation[path]
+
+    def disk(self, path="/dev/stub"):
+        disk = StubDisk([])
+        disk._device.path = path
+        return disk
+
+    def test_modes(self):
+        for mode, calls in [('full', ['dev', 'os']), ('device', ['dev']), ('os', ['os'])]:
+            del self.calls[:]
+            self.disk().commit(mode)
+            self.assertEqual(self.calls, calls, mode)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(DiskError):
+            self.disk().commit('later')
+
+    def test_image_never_notifies_kernel(self):
+        disk = self.disk()
+        disk._device.type = 'FILE'
+        disk.commit('full')
+        self.assertEqual(self.calls, ['dev'])
+
+    def test_deferred_coalesced(self):
+        disks = [self.disk("/dev/stub%d" % i) for i in range(3)]
+        for disk in disks:
+            disk.commit('deferred')
+        disks[0].commit('deferred')
+        self.assertEqual(self.calls, ['dev'] * 4)
+        del self.calls[:]
+        self.assertEqual(commit_deferred(), [])
+        self.assertEqual(self.calls, ['os'] * 3)
+        self.assertEqual(commit_deferred(), [])
+
+    def test_full_commit_dequeues(self):
+        disk = self.disk()
+        disk.commit('deferred')
+        disk.commit('full')
+        del self.calls[:]
+        commit_deferred()
+        self.assertEqual(self.calls, [])
+
+    def test_deferred_failure(self):
+        disk = self.disk()
+        disk.commit('deferred')
+        disk_module.disk_commit_to_os = lambda d: 0
+        self.assertEqual(commit_deferred(), [disk])
+
+    def test_deferred_waits_for_writer(self):
+        disk = self.disk()
+        disk.commit('deferred')
+        del self.calls[:]
+        held, release = threading.Event(), threading.Event()
+        def write():
+            with disk._lock.writing():
+                held.set()
+                release.wait()
+        writer = threading.Thread(target=write)
+        writer.start()
+        held.wait()
+        committer = threading.Thread(target=commit_deferred)
+        committer.start()
+        committer.join(0.2)
+        try:
+            self.assertEqual(self.calls, [])
+        finally:
+            release.set()
+            writer.join()
+        committer.join()
+        self.assertEqual(self.calls, ['os'])
+
+    def test_commit_errors(self):
+        disk_module.disk_commit_to_dev = lambda d: 0
+        with self.assertRaises(DiskCommitError):
+            self.disk().commit('device')
+
+@unittest.skipUnless(libparted_available(), "libparted is not available")
+class ApplyImageTest(ImageTestMixin, unittest.TestCase):
+    def test_replace_extended(self):
+        from reparted import Device
+        path = self.image_path()
+        write_msdos(path, [(2048, 20479)], [(22528, 40959), (43008, 60000)], (20480, 131071))
+        with Device(path) as device:
+            with Disk(device) as disk:
+                specs = [(Size(18432 * 512, "B"),), (Size(1, "MiB"),), (Size(1, "MiB"),)]
+                disk.apply(disk.diff(specs), mode='device')
+                self.assertEqual([p.type for p in disk.partitions()], ['NORMAL'] * 3)
+
+@unittest.skipUnless(libparted_available(), "libparted is not available")
+class ConcurrentImageTest(ImageTestMixin, unittest.TestCase):
+    """
+    Lists the partitions of an image from several threads while another
+    one adds, deletes, relabels and reloads the table.
+    """
+    rounds = 500
+
+    def test_readers_and_writer(self):
+        from reparted import Device, Partition
+        path = self.image_path()
+        write_gpt(path, [(2048, 4095, "a")])
+        errors = []
+        done = threading.Event()
+        with Device(path) as device:
+            with Disk(device) as disk:
+                def read():
+                    try:
+                        while not done.is_set():
+                            count = len(disk.partitions())
+                            layout = disk.to_dict()
+                            self.assertTrue(0 <= count <= 2)
+                            self.assertTrue(len(layout['partitions']) <= 2)
+                    except Exception as e:
+                        errors.append(e)
+                def write():
+                    try:
+                        for i in range(self.rounds):
+                            part = Partition(disk, Size(1, "MiB"), name="race")
+                            disk.add_partition(part)
+                            disk.delete_partition(part)
+                            if i % 50 == 0:
+                                disk.set_label("gpt")
+                            elif i % 10 == 0:
+                                disk.reload()
+                    except Exception as e:
+                        errors.append(e)
+                    finally:
+                        done.set()
+                threads = [threading.Thread(target=read) for i in range(4)]
+                threads.append(threading.Thread(target=write))
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+        self.assertEqual(errors, [])
+
+@unittest.skipUnless(libparted_available(), "libparted is not available")
+class AddPartitionSoakTest(ImageTestMixin, unittest.TestCase):
+    """
+    Adds and deletes partitions in a loop, libparted objects must be
+    freed exactly once and the RSS must level off.
+    """
+    rounds = 2000
+
+    def test_add_delete(self):
+        from reparted import Device, Partition
+        from reparted import conversion
+        path = self.image_path()
+        write_gpt(path, [])
+        conversion.reset_instrumentation()
+        conversion.enable_instrumentation()
+        try:
+            with Device(path) as device:
+                with Disk(device) as disk:
+                    with disk.transaction(mode='device'):
+                        for i in range(self.rounds):
+                            if i == self.rounds // 10:
+                                baseline = rss_kb()
+                            part = Partition(disk, Size(1, "MiB"), name="soak")
+                            disk.add_partition(part)
+                            disk.delete_partition(part)
+                            del part
+            stats = conversion.instrumentation_stats()
+        finally:
+            conversion.disable_instrumentation()
+        for kind, counts in stats['allocations'].items():
+            self.assertEqual(counts['created'], counts['destroyed'], kind)
+        self.assertLess(rss_kb() - baseline, 4096)
+
+@unittest.skipUnless(libparted_available(), "libparted is not available")
+class OpenCloseSoakTest(ImageTestMixin, unittest.TestCase):
+    """
+    Opens, scans and closes images in a loop, every other round the
+    Device and Disk are dropped without closing so the finalizers free
+    them, in whatever order the collector picks.
+    """
+    cycles = 100000
+
+    def test_open_scan_close(self):
+        from reparted import Device, device
+        from reparted.scan import scan
+        from reparted import conversion
+        import gc
+        paths = [self.image_path("soak%d.img" % i) for i in range(2)]
+        write_gpt(paths[0], [(2048, 4095, "a"), (4096, 8191, "b")])
+        write_msdos(paths[1], [(2048, 4095)], [], None)
+        conversion.reset_instrumentation()
+        conversion.enable_instrumentation()
+        try:
+            for i in range(self.cycles):
+                if i == self.cycles // 10:
+                    gc.collect()
+                    baseline = rss_kb()
+                path = paths[i % 2]
+                dev = Device(path)
+                disk = Disk(dev)
+                self.assertEqual(len(disk.partitions()), len(scan(path).partitions))
+                if i % 2:
+                    dev.close()
+                    disk.close()
+                del dev, disk
+            gc.collect()
+            stats = conversion.instrumentation_stats()
+        finally:
+            conversion.disable_instrumentation()
+        for kind, counts in stats['allocations'].items():
+            self.assertEqual(counts['created'], counts['destroyed'], kind)
+        self.assertEqual(device.device_refs, {})
+        self.assertLess(rss_kb() - baseline, 4096)
+
+if __name__ == '__main__':
+    unittest.main()
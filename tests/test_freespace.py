@@ -0,0 +1,70 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from reparted.freespace import FreeSpaceIndex, align_up
+import random
+import unittest
+
+def naive_first_fit(extents, sectors, grain, offset, after, lead):
+    for start, end in sorted(extents):
+        if end < after:
+            continue
+        s = align_up(max(start, after) + lead, grain, offset)
+        if s + sectors - 1 <= end:
+            return (s, s + sectors - 1)
+    return None
+
+class FreeSpaceIndexTest(unittest.TestCase):
+    def test_first_fit_skips_short_extents(self):
+        index = FreeSpaceIndex([(0, 9), (20, 29), (40, 139), (200, 299)])
+        self.assertEqual(index.first_fit(50), (40, 89))
+        self.assertEqual(index.first_fit(50, after=60), (60, 109))
+        self.assertEqual(index.first_fit(50, after=100), (200, 249))
+        self.assertEqual(index.first_fit(10, grain=8, offset=3), (43, 52))
+        self.assertEqual(index.first_fit(5, lead=1), (1, 5))
+        self.assertEqual(index.first_fit(200), None)
+
+    def test_first_fit_random(self):
+        rand = random.Random(9)
+        for n in range(300):
+            index = FreeSpaceIndex()
+            free = set()
+            for k in range(rand.randint(0, 40)):
+                start = rand.randint(0, 5000)
+                end = start + rand.randint(0, 300)
+                if rand.random() < .7:
+                    index.add(start, end)
+                    free.update(range(start, end + 1))
+                else:
+                    index.allocate(start, end)
+                    free.difference_update(range(start, end + 1))
+            extents = list(index)
+            sectors = sorted(free)
+            expected = []
+            for s in sectors:
+                if expected and expected[-1][1] == s - 1:
+                    expected[-1][1] = s
+                else:
+                    expected.append([s, s])
+            self.assertEqual(extents, [tuple(e) for e in expected])
+            for q in range(10):
+                args = (rand.randint(1, 200), rand.choice([1, 8, 64]), 0,
+                        rand.randint(0, 5000), rand.randint(0, 1))
+                grain = args[1]
+                args = args[:2] + (rand.randint(0, grain - 1),) + args[3:]
+                self.assertEqual(index.first_fit(*args), naive_first_fit(extents, *args))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from tests.helpers import ImageTestMixin, libparted_available, write_gpt
+from reparted import geometry
+from reparted.geometry import align_start, align_end, align_batch
+from reparted import Size
+import unittest
+
+class AlignTest(unittest.TestCase):
+    def test_start(self):
+        self.assertEqual(align_start(2048, 2048), 2048)
+        self.assertEqual(align_start(2049, 2048), 4096)
+        self.assertEqual(align_start(5, 8, 3), 11)
+        self.assertEqual(align_start(11, 8, 3), 11)
+
+    def test_end(self):
+        self.assertEqual(align_end(2048, 2048, 1), 4095)
+        self.assertEqual(align_end(2048, 2048, 2048, 2047), 4095)
+        self.assertEqual(align_end(2048, 3000, 2048, 2047), 4095)
+        self.assertEqual(align_end(2048, 1000, 2048, 2047), 3047)
+
+    def test_batch(self):
+        starts = [5, 2048, 2051, 100]
+        lengths = [16, 2048, 2048, 0]
+        expected = ([11, 2051, 2051, 107], [26, 4098, 4098, 106],
+                    [True, True, True, False])
+        result = geometry._align_python(starts, lengths, 8, 3, 1, 0, 0, 6000)
+        self.assertEqual(result, expected)
+        if geometry.numpy is not None:
+            result = geometry._align_numpy(starts, lengths, 8, 3, 1, 0, 0, 6000)
+            self.assertEqual(tuple(list(r) for r in result), expected)
+
+    def test_batch_end_grain(self):
+        starts, ends, valid = align_batch([2048], [2048], 2048, 0, 2048, 2047)
+        self.assertEqual((list(starts), list(ends), list(valid)), ([2048], [4095], [True]))
+
+    def test_batch_default_end(self):
+        starts, ends, valid = align_batch([2048, 4096], [2048, 1048576], 2048, 0)
+        self.assertEqual(list(ends), [4095, 1052671])
+        starts, ends, valid = align_batch([5], [16], 8, 3)
+        self.assertEqual((list(starts), list(ends)), ([11], [26]))
+
+@unittest.skipUnless(libparted_available(), "libparted is not available")
+class PartitionPlacementTest(ImageTestMixin, unittest.TestCase):
+    def test_matches_planner(self):
+        from reparted import Device, Disk, Partition
+        from reparted.planner import DiskModel
+        path = self.image_path()
+        write_gpt(path, [(2048, 4095, u'a'), (10240, 20479, u'b')])
+        with Device(path) as device:
+            with Disk(device) as disk:
+                size = Size(1, "MiB")
+                planned = DiskModel.from_disk(disk).plan([(size,)]).geoms[0]
+                part = Partition(disk, size)
+                disk.add_partition(part)
+                self.assertEqual(part.geom, planned)
+
+    def test_end_matches_planner(self):
+        from reparted import Device, Disk, Partition
+        from reparted.planner import DiskModel
+        path = self.image_path()
+        write_gpt(path, [])
+        with Device(path) as device:
+            with Disk(device) as disk:
+                # Not a whole number of grains, the end is rounded down.
+                size = Size(3, "MB")
+                planned = DiskModel.from_disk(disk).plan([(size,)]).geoms[0]
+                self.assertEqual(planned[1] % 2048, 2047)
+                part = Partition(disk, size)
+                disk.add_partition(part)
+                self.assertEqual(part.geom, planned)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from tests.helpers import ImageTestMixin, write_gpt, write_msdos, gpt_header
+from reparted.image import Image
+from reparted.scan import scan
+import unittest
+import zlib
+
+def crc(data):
+    return zlib.crc32(data) & 0xffffffff
+
+class ImageTest(ImageTestMixin, unittest.TestCase):
+    def assertValidGpt(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        for lba in (1, len(data) // 512 - 1):
+            header = data[lba * 512:lba * 512 + 92]
+            fields = list(gpt_header.unpack(header))
+            self.assertEqual(fields[0], b'EFI PART')
+            stored, fields[3] = fields[3], 0
+            self.assertEqual(crc(gpt_header.pack(*fields)), stored)
+            entries = data[fields[10] * 512:fields[10] * 512 + fields[11] * fields[12]]
+            self.assertEqual(crc(entries), fields[13])
+        return data[512 + 56:512 + 72]
+
+    def test_stamp_gets_new_guids(self):
+        template = self.image_path("template.img")
+        guids = write_gpt(template, [(2048, 10239, u'boot'), (10240, 131038, u'root')])
+        with Image(template, writable=False) as image:
+            regions = image.read_regions()
+        disk_guids = set([self.assertValidGpt(template)])
+        seen = set(guids)
+        for name in ("a.img", "b.img"):
+            path = self.image_path(name)
+            with Image(path) as image:
+                image.write_regions(regions)
+            disk_guids.add(self.assertValidGpt(path))
+            result = scan(path)
+            self.assertEqual([p.geom for p in result.partitions],
+                             [p.geom for p in scan(template).partitions])
+            for part in result.partitions:
+                self.assertFalse(part.guid in seen)
+                seen.add(part.guid)
+        self.assertEqual(len(disk_guids), 3)
+
+    def test_stamp_keeping_guids(self):
+        template = self.image_path("template.img")
+        guids = write_gpt(template, [(2048, 10239, u'boot')])
+        with Image(template, writable=False) as image:
+            regions = image.read_regions()
+        path = self.image_path("copy.img")
+        with Image(path) as image:
+            image.write_regions(regions, new_guids=False)
+        self.assertEqual([p.guid for p in scan(path).partitions], guids)
+
+    def test_msdos_signature(self):
+        path = self.image_path()
+        write_msdos(path, [(2048, 20479)])
+        with open(path, 'rb') as f:
+            before = f.read(512)
+        with Image(path) as image:
+            self.assertTrue(image.new_guids())
+        with open(path, 'rb') as f:
+            after = f.read(512)
+        self.assertNotEqual(before[440:444], after[440:444])
+        self.assertEqual(before[444:], after[444:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from tests.test_disk import StubDisk
+from reparted.conversion import PedPartition
+from reparted.partition import Partition
+from ctypes import pointer
+import threading
+import time
+import unittest
+
+class PartitionStressTest(unittest.TestCase):
+    """
+    Readers of the Partition properties must never see a geometry half
+    way through a change made under the disk write lock.
+    """
+    rounds = 2000
+
+    def test_geom_consistent(self):
+        ped = PedPartition()
+        ped.num = 1
+        ped.type = 0
+        ped.geom.start, ped.geom.length, ped.geom.end = 2048, 2048, 4095
+        disk = StubDisk([])
+        part = Partition(disk, part=pointer(ped))
+        done = threading.Event()
+        torn = []
+
+        def write():
+            for i in range(self.rounds):
+                with disk._lock.writing():
+                    ped.geom.start = 2048 * (i % 8 + 1)
+                    time.sleep(0)
+                    ped.geom.length = 2048 * (i % 3 + 1)
+                    time.sleep(0)
+                    ped.geom.end = ped.geom.start + ped.geom.length - 1
+            done.set()
+
+        def read():
+            while not done.is_set():
+                start, end, length = part.geom
+                if end - start + 1 != length:
+                    torn.append((start, end, length))
+                part.num, part.type
+
+        threads = [threading.Thread(target=read) for i in range(4)]
+        threads.append(threading.Thread(target=write))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(torn, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from reparted.planner import DiskModel, Weight, FILL
+from reparted import Size
+import pickle
+import unittest
+
+class PercentTest(unittest.TestCase):
+    def setUp(self):
+        # 1 GiB gpt disk with 1 MiB alignment.
+        self.model = DiskModel(2097152, 512, 2048)
+
+    def assertFits(self, result):
+        self.assertEqual(result.errors, [])
+        ends = [g[1] for g in result.geoms]
+        self.assertTrue(max(ends) <= 2097152 - 34)
+        for (s, e, n), (s2, e2, n2) in zip(result.geoms, result.geoms[1:]):
+            self.assertTrue(e < s2)
+
+    def test_halves(self):
+        result = self.model.plan([(50,), (50,)])
+        self.assertFits(result)
+        self.assertEqual(result.geoms[0][2], result.geoms[1][2])
+
+    def test_hundred(self):
+        self.assertFits(self.model.plan([(10,), (30,), (60,)]))
+        self.assertFits(self.model.plan([(100,)]))
+
+    def test_whole_grains(self):
+        result = self.model.plan([(33,), (Size(1, "MiB"),), (33,)])
+        self.assertFits(result)
+        for start, end, length in result.geoms:
+            self.assertEqual(start % 2048, 0)
+            self.assertEqual(length % 2048, 0)
+
+    def test_msdos(self):
+        model = DiskModel(2097152, 512, 2048, label='msdos')
+        self.assertFits(model.plan([(25,), (25,), (50,)]))
+
+    def test_weights_take_the_rest(self):
+        result = self.model.plan([(50,), (Weight(1),)])
+        self.assertFits(result)
+        self.assertEqual([e - s + 1 < 2048 for s, e in result.free], [True])
+
+    def test_end_aligned(self):
+        result = self.model.plan([(Size(500, "MB"),), (Size(1, "MiB"),)])
+        self.assertFits(result)
+        self.assertEqual(result.geoms, [(2048, 976895, 974848), (976896, 978943, 2048)])
+
+    def test_less_than_a_grain(self):
+        result = self.model.plan([(Size(1000, "B"),)])
+        self.assertEqual(result.geoms, [(2048, 2048, 1)])
+
+class WeightTest(unittest.TestCase):
+    def setUp(self):
+        # 1 GiB gpt disk with 1 MiB alignment, used from 4096 to 8191.
+        self.model = DiskModel(2097152, 512, 2048, partitions=[('NORMAL', 4096, 8191)])
+
+    def test_fill_skips_small_extents(self):
+        result = self.model.plan([(FILL,)])
+        self.assertEqual(result.geoms, [(8192, 2095103, 2086912)])
+
+    def test_sized_then_fill(self):
+        result = self.model.plan([(Size(1, "MiB"),), (Weight(1),), (Weight(1),)])
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.geoms[0], (2048, 4095, 2048))
+        # 1019 grains, the odd one goes to the first.
+        self.assertEqual(result.geoms[1:], [(8192, 1052671, 1044480),
+                                            (1052672, 2095103, 1042432)])
+
+    def test_pickle(self):
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            weight = pickle.loads(pickle.dumps(Weight(2.5), protocol))
+            self.assertEqual(weight.weight, Weight(2.5).weight)
+
+if __name__ == '__main__':
+    unittest.main()
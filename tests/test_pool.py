@@ -0,0 +1,79 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from reparted import pool
+import unittest
+
+class FakeDevice(object):
+    def __init__(self, path):
+        self.path = path
+        self.closed = False
+
+    def refresh(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+class FakeDisk(object):
+    def __init__(self, device):
+        self._device = device
+        self.stale = False
+        self.reloads = 0
+        self.closed = False
+
+    def reload(self):
+        self.reloads += 1
+        self.stale = False
+
+    def close(self):
+        self.closed = True
+
+class DevicePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (pool.Device, pool.Disk)
+        pool.Device, pool.Disk = FakeDevice, FakeDisk
+        self.pool = pool.DevicePool()
+
+    def tearDown(self):
+        pool.Device, pool.Disk = self.saved
+
+    def test_shared(self):
+        first = self.pool.acquire_disk("/dev/null")
+        second = self.pool.acquire_disk("/dev/null")
+        self.assertIs(first, second)
+
+    def test_reload_idle(self):
+        disk = self.pool.acquire_disk("/dev/null")
+        self.pool.release(disk)
+        disk.stale = True
+        self.assertIs(self.pool.acquire_disk("/dev/null"), disk)
+        self.assertEqual(disk.reloads, 1)
+
+    def test_no_reload_while_held(self):
+        held = self.pool.acquire_disk("/dev/null")
+        held.stale = True
+        self.pool.invalidate("/dev/null")
+        fresh = self.pool.acquire_disk("/dev/null")
+        self.assertIsNot(fresh, held)
+        self.assertEqual(held.reloads, 0)
+        self.assertFalse(held.closed)
+        self.pool.release(held)
+        self.assertTrue(held.closed)
+        self.assertFalse(fresh.closed)
+        self.assertIs(self.pool.acquire_disk("/dev/null"), fresh)
+
+if __name__ == '__main__':
+    unittest.main()
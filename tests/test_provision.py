@@ -0,0 +1,47 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from reparted.provision import provision, provision_device
+from reparted import Size
+import unittest
+
+specs = [(Size(1, "MiB"), 'NORMAL', 'ext4', 'root')]
+
+class ProvisionTest(unittest.TestCase):
+    """
+    Missing devices fail in Device before libparted is loaded, so the
+    result handling runs without it.
+    """
+    def test_failed_device(self):
+        result = provision_device("/nonexistent/disk", specs)
+        self.assertEqual(result.path, "/nonexistent/disk")
+        self.assertFalse(result.ok)
+        self.assertEqual(result.partitions, [])
+        self.assertTrue(result.error.startswith("DeviceError: "))
+        self.assertTrue(result.elapsed >= 0)
+
+    def test_results_and_callback(self):
+        paths = ["/nonexistent/a", "/nonexistent/b", "/nonexistent/c"]
+        seen = []
+        results = list(provision(paths, specs, processes=2, callback=seen.append))
+        self.assertEqual(sorted(r.path for r in results), paths)
+        self.assertEqual(seen, results)
+        self.assertEqual([r.ok for r in results], [False] * 3)
+
+    def test_no_paths(self):
+        self.assertEqual(list(provision([], specs)), [])
+
+if __name__ == '__main__':
+    unittest.main()
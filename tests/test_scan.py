@@ -0,0 +1,82 @@
+#This file is part of reparted.
+
+#reparted is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+
+#reparted is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+
+#You should have received a copy of the GNU General Public License
+#along with reparted.  If not, see <http://www.gnu.org/licenses/>.
+
+from tests.helpers import ImageTestMixin, libparted_available, write_gpt, write_msdos
+from tests.helpers import mbr, write_sector
+from reparted.scan import scan
+import unittest
+
+gpt_parts = [(2048, 10239, u'boot'), (10240, 131038, u'root')]
+
+msdos_primaries = [(2048, 20479)]
+msdos_extended = (20480, 131071)
+msdos_logicals = [(22528, 40959), (43008, 60000), (62000, 131071)]
+
+class ScanTest(ImageTestMixin, unittest.TestCase):
+    def test_blank_image(self):
+        result = scan(self.image_path())
+        self.assertEqual(result.label, None)
+        self.assertEqual(result.partitions, [])
+
+    def test_gpt(self):
+        path = self.image_path()
+        guids = write_gpt(path, gpt_parts)
+        result = scan(path)
+        self.assertEqual(result.label, 'gpt')
+        self.assertEqual(result.length, 131072)
+        self.assertEqual([(p.num, p.geom[:2], p.name, p.guid) for p in result.partitions],
+                         [(i + 1, (s, e), n, g) for i, ((s, e, n), g)
+                          in enumerate(zip(gpt_parts, guids))])
+
+    def test_msdos_ebr_chain(self):
+        path = self.image_path()
+        write_msdos(path, msdos_primaries, msdos_logicals, msdos_extended)
+        result = scan(path)
+        self.assertEqual(result.label, 'msdos')
+        self.assertEqual([(p.num, p.type, p.geom[:2]) for p in result.partitions],
+                         [(1, 'NORMAL', (2048, 20479)), (2, 'EXTENDED', msdos_extended),
+                          (5, 'LOGICAL', msdos_logicals[0]), (6, 'LOGICAL', msdos_logicals[1]),
+                          (7, 'LOGICAL', msdos_logicals[2])])
+
+    def test_ebr_loop_ends(self):
+        path = self.image_path()
+        write_msdos(path, [], [(22528, 40959), (43008, 60000)], msdos_extended)
+        # Point the second EBR back at itself.
+        link = [(0x83, 1, 16993), (0x05, 43007 - msdos_extended[0], 16994)]
+        write_sector(path, 43007, mbr(link))
+        result = scan(path)
+        self.assertEqual(len([p for p in result.partitions if p.type == 'LOGICAL']), 2)
+
+@unittest.skipUnless(libparted_available(), "libparted is not available")
+class ScanLibpartedTest(ImageTestMixin, unittest.TestCase):
+    def assertSameAsLibparted(self, path):
+        from reparted import Device, Disk
+        with Device(path) as device:
+            with Disk(device) as disk:
+                expected = sorted((p.num, p.geom) for p in disk.partitions())
+        self.assertEqual(sorted((p.num, p.geom) for p in scan(path).partitions), expected)
+
+    def test_gpt(self):
+        path = self.image_path()
+        write_gpt(path, gpt_parts)
+        self.assertSameAsLibparted(path)
+
+    def test_msdos_ebr_chain(self):
+        path = self.image_path()
+        write_msdos(path, msdos_primaries, msdos_logicals, msdos_extended)
+        self.assertSameAsLibparted(path)
+
+if __name__ == '__main__':
+    unittest.main()